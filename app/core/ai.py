@@ -1,24 +1,17 @@
+import asyncio
 import os
 import glob
+import json
 import logging
 from textwrap import dedent
-from openai import AsyncOpenAI
 from core.config import settings
+from core.http_clients import clients
 
 # [전역 변수] 문단 단위로 쪼개진 지식 조각들 (Chunks)
 KNOWLEDGE_CHUNKS = []
 
 logger = logging.getLogger("uvicorn")
 
-client = AsyncOpenAI(
-    api_key=settings.OPENROUTER_API_KEY,
-    base_url="https://openrouter.ai/api/v1",
-    default_headers={
-        "HTTP-Referer": settings.SITE_URL, 
-        "X-Title": settings.SITE_NAME,
-    }
-)
-
 def load_and_chunk_files(directory: str):
     """
     MD 파일을 읽어서 '문단(\n\n)' 단위로 쪼개서 리스트에 저장함.
@@ -45,12 +38,15 @@ def load_and_chunk_files(directory: str):
             
     return chunks
 
-async def generate_response_stream(
-    prompt: str, 
-    mode: str = 'general',
-    context: str = '', # worker.py에서 검색된 RAG 데이터가 여기에 들어옵니다.
+def build_messages(
+    prompt: str,
+    context: str = '',
     history: list[dict] = None
-):
+) -> list[dict]:
+    """
+    LLM 에 보낼 메시지 배열 구성
+    [System Message] -> [History] -> [User Question] 순서
+    """
     if history is None:
         history = []
 
@@ -104,19 +100,39 @@ async def generate_response_stream(
     # 현재 사용자 질문 추가
     messages.append({"role": "user", "content": prompt})
 
+    return messages
+
+async def generate_response_stream(
+    prompt: str, 
+    mode: str = 'general',
+    context: str = '', # worker.py에서 검색된 RAG 데이터가 여기에 들어옵니다.
+    history: list[dict] = None,
+    usage: dict = None, # 전달하면 스트림 마지막의 Provider usage 를 {"input", "output"} 로 채워줌
+):
+    messages = build_messages(prompt, context, history)
+
     try:
         # ---------------------------------------------------------
         # 3. LLM 호출 및 스트리밍
         # ---------------------------------------------------------
-        stream = await client.chat.completions.create(
+        stream = await clients.openai.chat.completions.create(
             model=settings.OPENROUTER_MODEL, # worker.py의 설정을 따름
             messages=messages,
             stream=True,
             temperature=0.7, # 창의성과 사실성의 밸런스
             # max_tokens=1000, # 필요 시 제한
+            stream_options={"include_usage": True}, # 마지막 청크에 실제 토큰 사용량 포함
         )
 
         async for chunk in stream:
+            # usage 청크는 choices 가 비어 있음
+            if chunk.usage and usage is not None:
+                usage["input"] = chunk.usage.prompt_tokens
+                usage["output"] = chunk.usage.completion_tokens
+
+            if not chunk.choices:
+                continue
+
             content = chunk.choices[0].delta.content
             if content:
                 yield content
@@ -125,17 +141,41 @@ async def generate_response_stream(
         logger.error(f"❌ AI Generation Error: {e}")
         raise e
 
-async def generate_summary(original_text: str, model: str = None) -> dict:
+# 이보다 짧은 답변은 요약하지 않고 원문 사용
+SUMMARY_BYPASS_CHARS = 150
+
+SUMMARY_SYSTEM_PROMPT = dedent("""
+당신은 대화 요약 전문가입니다. AI 어시스턴트의 답변을 3문장 이내의 한 문단으로 요약합니다.
+
+## 요약 원칙
+1. **핵심 결론/답변**을 첫 문장에 배치
+2. **구체적 데이터**(숫자, 이름, 코드명 등)는 반드시 보존
+3. **사용자가 다음 질문에 활용할 맥락**을 우선 포함
+
+## 제외 대상
+- 인사말, 부연 설명, 예시의 상세 내용
+- "~할 수 있습니다", "~것 같습니다" 등의 완곡 표현
+
+## 출력 형식
+- 한 문단, 3문장 이내
+- 존댓말 없이 간결한 정보 전달체 사용
+""").strip()
+
+BATCH_SUMMARY_INSTRUCTION = dedent("""
+## 여러 답변 요약
+- 입력은 {"items": [{"id": 번호, "text": 답변}]} 형태의 JSON 입니다.
+- 각 답변을 위 원칙대로 따로 요약하고, 다른 답변의 내용을 섞지 마세요.
+- {"summaries": [{"id": 번호, "summary": 요약}]} 형태의 JSON 만 출력하세요.
+""").strip()
+
+def bypass_summary(original_text: str) -> dict | None:
     """
-    Main Worker 의 답변을 요약하는 함수
-    - 입력 : 원본 답변 텍스트
-    - 출력 : {"summary": "요약된 텍스트", "usage": {input, output, model}}
+    LLM 호출 없이 끝나는 경우 (빈 답변 / 짧은 답변)
     """
-
     if not original_text:
         return {"summary": "", "usage": {}}
 
-    if len(original_text) < 150:
+    if len(original_text) < SUMMARY_BYPASS_CHARS:
         return {
             "summary": original_text, 
             "usage": {
@@ -145,30 +185,34 @@ async def generate_summary(original_text: str, model: str = None) -> dict:
             }
         }
 
-    system_prompt = dedent("""
-    당신은 대화 요약 전문가입니다. AI 어시스턴트의 답변을 3문장 이내의 한 문단으로 요약합니다.
+    return None
 
-    ## 요약 원칙
-    1. **핵심 결론/답변**을 첫 문장에 배치
-    2. **구체적 데이터**(숫자, 이름, 코드명 등)는 반드시 보존
-    3. **사용자가 다음 질문에 활용할 맥락**을 우선 포함
+def usage_tokens(response) -> tuple[int, int]:
+    usage_info = response.usage
+    if usage_info:
+        return usage_info.prompt_tokens, usage_info.completion_tokens
 
-    ## 제외 대상
-    - 인사말, 부연 설명, 예시의 상세 내용
-    - "~할 수 있습니다", "~것 같습니다" 등의 완곡 표현
+    logger.warning("⚠️ Usage info missing in API response.")
+    return 0, 0
+
+async def generate_summary(original_text: str, model: str = None) -> dict:
+    """
+    Main Worker 의 답변을 요약하는 함수
+    - 입력 : 원본 답변 텍스트
+    - 출력 : {"summary": "요약된 텍스트", "usage": {input, output, model}}
+    """
+
+    bypassed = bypass_summary(original_text)
+    if bypassed is not None:
+        return bypassed
 
-    ## 출력 형식
-    - 한 문단, 3문장 이내
-    - 존댓말 없이 간결한 정보 전달체 사용
-    """).strip()
-    
     try:
         target_model = model if model else settings.OPENROUTER_MODEL
 
-        response = await client.chat.completions.create(
+        response = await clients.openai.chat.completions.create(
             model=target_model,
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
                 {"role": "user", "content": original_text}
             ],
             stream=False,
@@ -176,15 +220,7 @@ async def generate_summary(original_text: str, model: str = None) -> dict:
         )
 
         summary_text = response.choices[0].message.content.strip()
-        usage_info = response.usage
-
-        if usage_info:
-            input_tokens = usage_info.prompt_tokens
-            output_tokens = usage_info.completion_tokens
-        else:
-            logger.warning("⚠️ Usage info missing in API response.")
-            input_tokens = 0
-            output_tokens = 0
+        input_tokens, output_tokens = usage_tokens(response)
 
         return {
             "summary": summary_text,
@@ -200,4 +236,84 @@ async def generate_summary(original_text: str, model: str = None) -> dict:
         return {
             "summary": original_text[:500],
             "usage": {}
-        }
\ No newline at end of file
+        }
+
+async def generate_summary_group(texts: list[str], model: str = None) -> list[dict]:
+    """
+    여러 답변을 LLM 한 번 호출로 요약 (JSON 입출력)
+    - 토큰 사용량은 입력 / 요약 길이 비율로 나눠서 기록
+    - 응답이 깨지거나 개수가 맞지 않으면 하나씩 요약
+    """
+    if len(texts) == 1:
+        return [await generate_summary(texts[0], model)]
+
+    target_model = model if model else settings.OPENROUTER_MODEL
+    try:
+        response = await clients.openai.chat.completions.create(
+            model=target_model,
+            messages=[
+                {"role": "system", "content": f"{SUMMARY_SYSTEM_PROMPT}\n\n{BATCH_SUMMARY_INSTRUCTION}"},
+                {"role": "user", "content": json.dumps(
+                    {"items": [{"id": i, "text": text} for i, text in enumerate(texts)]},
+                    ensure_ascii=False,
+                )},
+            ],
+            stream=False,
+            temperature=0.3,
+            response_format={"type": "json_object"},
+        )
+
+        parsed = json.loads(response.choices[0].message.content)
+        summaries = {int(item["id"]): str(item["summary"]).strip() for item in parsed["summaries"]}
+        if sorted(summaries) != list(range(len(texts))) or not all(summaries.values()):
+            raise ValueError(f"expected {len(texts)} summaries, got ids {sorted(summaries)}")
+    except Exception as e:
+        logger.warning(f"⚠️ Batch summary failed, summarizing one by one ({len(texts)}): {e}")
+        return list(await asyncio.gather(*[generate_summary(text, model) for text in texts]))
+
+    input_tokens, output_tokens = usage_tokens(response)
+    input_chars = sum(len(text) for text in texts) or 1
+    output_chars = sum(len(summary) for summary in summaries.values()) or 1
+
+    return [
+        {
+            "summary": summaries[i],
+            "usage": {
+                "input": round(input_tokens * len(text) / input_chars),
+                "output": round(output_tokens * len(summaries[i]) / output_chars),
+                "model": target_model,
+                "batch": len(texts),
+            }
+        }
+        for i, text in enumerate(texts)
+    ]
+
+async def generate_summaries(texts: list[str], model: str = None) -> list[dict]:
+    """
+    요약 배치 처리
+    - 짧은 답변은 bypass
+    - 나머지는 SUMMARY_BATCH_MAX_CHARS 단위로 묶어 그룹마다 LLM 한 번 (그룹끼리는 동시 호출)
+    - 반환 순서는 입력 순서와 같음
+    """
+    results: list[dict | None] = [bypass_summary(text) for text in texts]
+
+    groups: list[list[int]] = []
+    group_chars = 0
+    for i, text in enumerate(texts):
+        if results[i] is not None:
+            continue
+        if not groups or group_chars + len(text) > settings.SUMMARY_BATCH_MAX_CHARS:
+            groups.append([])
+            group_chars = 0
+        groups[-1].append(i)
+        group_chars += len(text)
+
+    group_results = await asyncio.gather(*[
+        generate_summary_group([texts[i] for i in group], model)
+        for group in groups
+    ])
+    for group, summaries in zip(groups, group_results):
+        for i, summary in zip(group, summaries):
+            results[i] = summary
+
+    return results
@@ -0,0 +1,230 @@
+import asyncio
+import codecs
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+from core.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+HEADERS_TO_SPLIT_ON = [
+  ("#", "Header 1"),
+  ("##", "Header 2"),
+  ("###", "Header 3"),
+  ("####", "Header 4"),
+]
+
+class Chunk(NamedTuple):
+  """
+  프로세스 사이로 주고받는 청크 (langchain Document 대신 가벼운 tuple)
+  """
+  content: str
+  metadata: dict
+
+def split_sections(sections: list[str], chunk_size: int, chunk_overlap: int) -> list[Chunk]:
+  """
+  [자식 프로세스에서 실행] 헤더 섹션 → 청크
+  1. 헤더 기준 크게 자르기 (섹션 앞에 상위 헤더가 붙어 있어서 메타데이터가 문서 전체를 자를 때와 같음)
+  2. 문자수 기준 작은 단위로 재귀 자르기
+  """
+  markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON)
+  text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=chunk_size,
+    chunk_overlap=chunk_overlap,
+  )
+
+  chunks = []
+  for section in sections:
+    md_header_splits = markdown_splitter.split_text(section)
+    for doc in text_splitter.split_documents(md_header_splits):
+      chunks.append(Chunk(doc.page_content, doc.metadata))
+  return chunks
+
+def _warm_up() -> int:
+  """
+  [자식 프로세스에서 실행] 모듈 import + 스플리터 초기화를 미리 끝내둠
+  """
+  split_sections(["# warm up\n\nready"], 100, 0)
+  return multiprocessing.current_process().pid
+
+class MarkdownSectionStream:
+  """
+  바이트 조각을 받아 완성된 헤더 섹션 단위로 내보내는 증분 스캐너
+  - 다음 헤더(# ~ ####)가 나오면 이전 섹션이 완성됨 (코드 블록 안의 # 은 무시)
+  - 섹션 앞에 상위 헤더 줄을 붙여서 내보냄 → split_sections 가 같은 메타데이터를 만듦
+  - 헤더 없이 긴 본문은 max_section_chars 마다 끊어서 내보내 메모리 상한 유지
+  """
+
+  def __init__(
+    self,
+    preview_chars: int = settings.CHUNK_METADATA_PREVIEW_CHARS,
+    max_section_chars: int = settings.CHUNK_MAX_SECTION_CHARS,
+  ):
+    self.preview_chars = preview_chars
+    self.max_section_chars = max_section_chars
+    self.preview = ""
+    self.bytes_read = 0
+
+    # 멀티바이트 문자가 조각 경계에서 잘려도 안전하게 디코딩
+    self._decoder = codecs.getincrementaldecoder("utf-8")()
+    self._partial_line = ""
+    self._fence: str | None = None
+
+    # 작성 중인 섹션
+    self._headers: list[tuple[int, str]] = [] # (레벨, 헤더 줄)
+    self._lines: list[str] = []
+    self._size = 0
+
+    # 완성됐지만 다음 섹션과 합쳐질 수 있어 보류 중인 섹션
+    self._held_headers: list[tuple[int, str]] | None = None
+    self._held_lines: list[str] = []
+    self._held_size = 0
+
+  @property
+  def preview_ready(self) -> bool:
+    return len(self.preview) >= self.preview_chars
+
+  def feed(self, data: bytes) -> list[str]:
+    self.bytes_read += len(data)
+    return self._consume(self._decoder.decode(data))
+
+  def finish(self) -> list[str]:
+    sections = self._consume(self._decoder.decode(b"", final=True))
+    if self._partial_line:
+      self._add_line(self._partial_line, sections)
+      self._partial_line = ""
+    self._close_section(sections)
+    self._release(sections)
+    return sections
+
+  def _consume(self, text: str) -> list[str]:
+    if len(self.preview) < self.preview_chars:
+      self.preview += text[:self.preview_chars - len(self.preview)]
+
+    lines = (self._partial_line + text).split("\n")
+    self._partial_line = lines.pop()
+
+    sections = []
+    for line in lines:
+      self._add_line(line, sections)
+    return sections
+
+  def _add_line(self, line: str, sections: list[str]):
+    # 코드 블록 / 헤더 판정은 MarkdownHeaderTextSplitter 와 같은 규칙
+    stripped = "".join(filter(str.isprintable, line.strip()))
+
+    if self._fence:
+      if stripped.startswith(self._fence):
+        self._fence = None
+    elif stripped.startswith("```") and stripped.count("```") == 1:
+      self._fence = "```"
+    elif stripped.startswith("~~~"):
+      self._fence = "~~~"
+    else:
+      level = self._header_level(stripped)
+      if level:
+        self._close_section(sections)
+        self._headers = [(lvl, text) for lvl, text in self._headers if lvl < level]
+        self._headers.append((level, stripped))
+        return
+
+    self._lines.append(line)
+    self._size += len(line) + 1
+    if self._size >= self.max_section_chars and not self._fence:
+      self._close_section(sections)
+      self._release(sections)
+
+  def _close_section(self, sections: list[str]):
+    lines, size = self._lines, self._size
+    self._lines, self._size = [], 0
+
+    if not any(line.strip() for line in lines):
+      return
+
+    if self._held_headers == self._headers:
+      # 같은 메타데이터의 연속 구간은 MarkdownHeaderTextSplitter 가 하나로 합치므로 함께 자름
+      self._held_lines += [self._headers[-1][1]] + lines
+      self._held_size += size
+    else:
+      self._release(sections)
+      self._held_headers = list(self._headers)
+      self._held_lines = lines
+      self._held_size = size
+
+    if self._held_size >= self.max_section_chars:
+      self._release(sections)
+
+  def _release(self, sections: list[str]):
+    if self._held_lines:
+      header_lines = [text for _, text in self._held_headers]
+      sections.append("\n".join(header_lines + self._held_lines))
+    self._held_headers = None
+    self._held_lines, self._held_size = [], 0
+
+  @staticmethod
+  def _header_level(stripped: str) -> int:
+    for separator, _ in sorted(HEADERS_TO_SPLIT_ON, key=lambda item: len(item[0]), reverse=True):
+      if stripped.startswith(separator) and (len(stripped) == len(separator) or stripped[len(separator)] == " "):
+        return len(separator)
+    return 0
+
+_executor: ProcessPoolExecutor | None = None
+
+def get_executor() -> ProcessPoolExecutor:
+  global _executor
+  if _executor is None:
+    # fork 는 이벤트 루프 / 커넥션 상태까지 복제하므로 spawn 사용
+    _executor = ProcessPoolExecutor(
+      max_workers=settings.CHUNKING_PROCESS_WORKERS,
+      mp_context=multiprocessing.get_context("spawn"),
+    )
+  return _executor
+
+async def warm_up_chunking_pool():
+  """
+  최초 업로드가 프로세스 기동 비용을 떠안지 않도록 lifespan 에서 미리 워커 생성
+  """
+  if settings.CHUNKING_PROCESS_WORKERS <= 0:
+    return
+
+  loop = asyncio.get_running_loop()
+  executor = get_executor()
+  try:
+    pids = await asyncio.gather(*[
+      loop.run_in_executor(executor, _warm_up)
+      for _ in range(settings.CHUNKING_PROCESS_WORKERS)
+    ])
+    logger.info(f"✅ Chunking process pool ready: {sorted(set(pids))}")
+  except Exception as e:
+    logger.warning(f"⚠️ Chunking process pool warm-up failed: {e}")
+
+def shutdown_chunking_pool():
+  global _executor
+  if _executor is not None:
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+async def split_sections_async(sections: list[str]) -> list[Chunk]:
+  """
+  청킹을 프로세스 풀에서 실행 (이벤트 루프 / 채팅 스트리밍을 막지 않음)
+  - CHUNKING_PROCESS_WORKERS=0 이면 스레드에서 실행
+  """
+  if not sections:
+    return []
+
+  args = (sections, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+
+  if settings.CHUNKING_PROCESS_WORKERS <= 0:
+    return await asyncio.to_thread(split_sections, *args)
+
+  loop = asyncio.get_running_loop()
+  try:
+    return await loop.run_in_executor(get_executor(), split_sections, *args)
+  except BrokenProcessPool:
+    # 자식 프로세스가 죽으면(OOM 등) 풀 전체가 못 쓰게 되므로 다음 작업을 위해 새로 만듦
+    logger.error("❌ Chunking process pool broken, recreating")
+    shutdown_chunking_pool()
+    raise
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import deque
+import openai
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from core.config import settings
+from core.database import engine
+
+logger = logging.getLogger("uvicorn")
+
+# 이름 → limiter (메트릭 / 헬스 체크에서 조회)
+limiters: dict[str, "AdaptiveLimiter"] = {}
+
+def is_overload_error(e: BaseException) -> bool:
+  """
+  동시성을 줄여야 하는 에러 (Provider 429 / DB 커넥션 풀 타임아웃)
+  """
+  if isinstance(e, (openai.RateLimitError, PoolTimeoutError)):
+    return True
+  if isinstance(e, openai.APIStatusError):
+    return e.status_code == 429
+  return False
+
+def db_pool_saturated() -> bool:
+  """
+  DB 커넥션 풀이 pool_size + max_overflow 까지 모두 사용 중인지
+  """
+  pool = engine.pool
+  try:
+    capacity = pool.size() + getattr(pool, "_max_overflow", 0)
+    return pool.checkedout() >= capacity
+  except Exception:
+    return False
+
+class AdaptiveLimiter:
+  """
+  적응형 동시성 제한 (AIMD + 지연 기울기)
+  - 윈도우(window_sec)마다 한 번 조정
+  - 과부하 에러(429, 풀 타임아웃) 발생 → limit * backoff_ratio (Multiplicative Decrease)
+  - p95 지연이 장기 기준선 * latency_tolerance 초과 → limit - 1
+  - 정상이고 한도 가까이 사용 중이며 DB 풀 여유 있음 → limit + sqrt(limit) (Additive Increase)
+  """
+
+  def __init__(
+    self,
+    name: str,
+    initial: int,
+    min_limit: int,
+    max_limit: int,
+    window_sec: float = settings.CONCURRENCY_WINDOW_SEC,
+    latency_tolerance: float = settings.CONCURRENCY_LATENCY_TOLERANCE,
+    backoff_ratio: float = settings.CONCURRENCY_BACKOFF_RATIO,
+  ):
+    if not settings.ADAPTIVE_CONCURRENCY_ENABLED:
+      min_limit = max_limit = initial
+
+    self.name = name
+    self.limit = initial
+    self.min_limit = min_limit
+    self.max_limit = max_limit
+    self.window_sec = window_sec
+    self.latency_tolerance = latency_tolerance
+    self.backoff_ratio = backoff_ratio
+
+    self.in_flight = 0
+    self._waiters: deque[asyncio.Future] = deque()
+    # attach 된 진행 중 작업 (종료 시 drain)
+    self._tasks: set[asyncio.Task] = set()
+
+    self._latencies: list[float] = []
+    self._overloaded = 0
+    self._peak_in_flight = 0
+    self._baseline: float | None = None
+    self._window_started = time.monotonic()
+
+    limiters[name] = self
+
+  @property
+  def available(self) -> int:
+    return max(0, self.limit - self.in_flight)
+
+  async def acquire(self):
+    """
+    슬롯 하나 확보 (한도가 차 있으면 release 가 넘겨줄 때까지 대기)
+    """
+    if self.in_flight < self.limit and not self._waiters:
+      self._take()
+      return
+
+    future = asyncio.get_running_loop().create_future()
+    self._waiters.append(future)
+    try:
+      await future
+    except asyncio.CancelledError:
+      if future.done() and not future.cancelled():
+        # 슬롯을 넘겨받은 직후 취소된 경우 반납
+        self.release()
+      elif future in self._waiters:
+        # _wake 가 이미 꺼내 간 (취소된) future 는 큐에 없음
+        self._waiters.remove(future)
+      raise
+
+  def release(self, latency: float = None):
+    """
+    슬롯 반납 (latency 가 있으면 조정용 표본으로 기록)
+    """
+    self.in_flight -= 1
+    if latency is not None:
+      self._latencies.append(latency)
+    self._maybe_adjust()
+    self._wake()
+
+  def attach(self, task: asyncio.Task):
+    """
+    acquire 이후 생성한 작업에 연결 → 작업이 끝나면 처리 시간과 함께 반납
+    """
+    started_at = time.monotonic()
+    self._tasks.add(task)
+
+    def done(t: asyncio.Task):
+      self._tasks.discard(t)
+      self.release(time.monotonic() - started_at)
+
+    task.add_done_callback(done)
+
+  async def drain(self, timeout: float):
+    """
+    종료 시 진행 중인 작업이 끝나기를 최대 timeout 초 기다림
+    - 시간 안에 끝나지 않은 작업은 취소 후 정리될 때까지 대기
+    """
+    if not self._tasks:
+      return
+
+    logger.info(f"⏳ Draining {len(self._tasks)} in-flight {self.name} job(s)...")
+    _, pending = await asyncio.wait(list(self._tasks), timeout=timeout)
+
+    if pending:
+      logger.warning(f"⚠️ {len(pending)} {self.name} job(s) still running after {timeout}s, cancelling")
+      for task in pending:
+        task.cancel()
+      await asyncio.gather(*pending, return_exceptions=True)
+
+  def record_error(self, e: BaseException):
+    """
+    작업 내부에서 잡힌 에러 보고 (과부하 에러만 반영)
+    """
+    if is_overload_error(e):
+      self._overloaded += 1
+
+  def snapshot(self) -> dict:
+    return {
+      "limit": self.limit,
+      "in_flight": self.in_flight,
+      "available": self.available,
+      "waiting": len(self._waiters),
+    }
+
+  def _take(self):
+    self.in_flight += 1
+    self._peak_in_flight = max(self._peak_in_flight, self.in_flight)
+
+  def _wake(self):
+    while self._waiters and self.in_flight < self.limit:
+      future = self._waiters.popleft()
+      if not future.done():
+        self._take()
+        future.set_result(None)
+
+  def _maybe_adjust(self):
+    now = time.monotonic()
+    if now - self._window_started < self.window_sec:
+      return
+
+    previous = self.limit
+    reason = None
+    p95 = None
+
+    if self._latencies:
+      ordered = sorted(self._latencies)
+      p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    if self._overloaded:
+      self.limit = max(self.min_limit, int(self.limit * self.backoff_ratio))
+      reason = f"overload x{self._overloaded}"
+    elif p95 is not None and self._baseline is not None and p95 > self._baseline * self.latency_tolerance:
+      self.limit = max(self.min_limit, self.limit - 1)
+      reason = f"latency p95 {p95:.2f}s > baseline {self._baseline:.2f}s"
+    elif self._peak_in_flight >= self.limit * 0.8 and not db_pool_saturated():
+      self.limit = min(self.max_limit, self.limit + max(1, int(math.sqrt(self.limit))))
+      reason = "healthy"
+
+    # 기준선은 천천히 따라감 (장기 지연)
+    if p95 is not None:
+      self._baseline = p95 if self._baseline is None else self._baseline * 0.9 + p95 * 0.1
+
+    if self.limit != previous:
+      logger.info(json.dumps({
+        "level": "info",
+        "event": "concurrency_limit_changed",
+        "worker": self.name,
+        "from": previous,
+        "to": self.limit,
+        "reason": reason,
+      }))
+
+    self._latencies.clear()
+    self._overloaded = 0
+    self._peak_in_flight = self.in_flight
+    self._window_started = now
@@ -23,6 +23,170 @@ class Settings(BaseSettings):
     NEST_API_URL: str = "http://localhost:5859"
     INTERNAL_WEBHOOK_SECRET: str = ""
 
+    # 채팅 스트림 발송 설정 (토큰 Coalescing)
+    STREAM_FLUSH_INTERVAL_MS: int = 30  # 0 이하이면 토큰마다 즉시 발송
+    STREAM_FLUSH_MAX_BYTES: int = 1024
+
+    # 채팅 전송 방식
+    # - pubsub : chat:stream:{uuid}-{sessionId} 채널로 PUBLISH (기존 방식)
+    # - stream : chat:stream:{uuid}-{sessionId}:{jobId} 스트림으로 XADD (재접속 시 마지막 ID 부터 이어 읽기 가능)
+    CHAT_STREAM_TRANSPORT: str = "pubsub"
+    CHAT_STREAM_MAXLEN: int = 2000
+    CHAT_STREAM_TTL_SEC: int = 600
+
+    # 채팅 작업 수신 방식
+    # - list : chat:job:queue BRPOP (기존 방식)
+    # - stream : chat:job:stream XREADGROUP / XACK (at-least-once, 죽은 Pod 의 작업은 XAUTOCLAIM 으로 회수)
+    CHAT_JOB_INTAKE: str = "list"
+    CHAT_JOB_STREAM: str = "chat:job:stream"
+    CHAT_JOB_GROUP: str = "protostar-chat-workers"
+    CHAT_JOB_CLAIM_IDLE_MS: int = 120000
+    CHAT_JOB_CLAIM_INTERVAL_SEC: int = 30
+    # 처리 중인 작업은 이 주기로 XCLAIM JUSTID → idle 시간이 CHAT_JOB_CLAIM_IDLE_MS 를 넘지 않아 회수되지 않음
+    CHAT_JOB_CLAIM_HEARTBEAT_SEC: int = 30
+    # 소비자 이름 (비어 있으면 호스트명 = Pod 이름), 재시작해도 같은 이름으로 이어 받음
+    CHAT_JOB_CONSUMER_NAME: str = ""
+    # PEL 이 비어 있고 이 시간 이상 활동이 없는 소비자는 그룹에서 삭제 (사라진 Pod 정리)
+    CHAT_JOB_CONSUMER_IDLE_MS: int = 60 * 60 * 1000
+
+    # 임베딩 캐시 (프로세스 내 LRU + Redis)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_LOCAL_SIZE: int = 2048
+    EMBEDDING_CACHE_TTL_SEC: int = 60 * 60 * 24 * 7
+
+    # 대화 기록 윈도우 (최근 N개 메시지 + 토큰 예산) 및 세션별 Redis 캐시
+    CHAT_HISTORY_WINDOW_MESSAGES: int = 20
+    CHAT_HISTORY_TOKEN_BUDGET: int = 4000
+    CHAT_HISTORY_CACHE_SIZE: int = 40
+    CHAT_HISTORY_CACHE_TTL_SEC: int = 60 * 60 * 24
+
+    # 채팅 프롬프트 입력 토큰 예산 (초과 시 오래된 기록 → 낮은 순위 RAG 문서 순으로 제거)
+    CHAT_CONTEXT_TOKEN_BUDGET: int = 12000
+
+    # 의미 기반 응답 캐시 (opt-in)
+    # - 질문 임베딩 유사도가 임계값 이상이면 저장된 답변을 스트림으로 재생 (RAG + LLM 생략)
+    # - 같은 mode + 같은 지식 베이스 버전에서만 재사용, base context 가 있는 요청 / 대화 기록이 있는 턴은 제외
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_MODES: list[str] = ["general"]
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_TTL_SEC: int = 60 * 60 * 24 * 7
+    SEMANTIC_CACHE_REPLAY_CHUNK_CHARS: int = 12
+    SEMANTIC_CACHE_REPLAY_DELAY_MS: int = 10
+    # 만료 / 지난 지식 베이스 버전 항목 삭제 주기
+    SEMANTIC_CACHE_PURGE_INTERVAL_SEC: int = 60 * 60
+
+    # 워커 적응형 동시성 (AIMD)
+    # - 429 / DB 풀 타임아웃 → 축소, p95 지연 급증 → 1 감소, 정상 + 한도 근접 사용 → 증가
+    # - 비활성화하면 *_INITIAL 값으로 고정
+    ADAPTIVE_CONCURRENCY_ENABLED: bool = True
+    CONCURRENCY_WINDOW_SEC: float = 5.0
+    CONCURRENCY_LATENCY_TOLERANCE: float = 2.0
+    CONCURRENCY_BACKOFF_RATIO: float = 0.7
+    CHAT_CONCURRENCY_INITIAL: int = 100
+    CHAT_CONCURRENCY_MIN: int = 10
+    CHAT_CONCURRENCY_MAX: int = 200
+    SUMMARY_CONCURRENCY_INITIAL: int = 50
+    SUMMARY_CONCURRENCY_MIN: int = 5
+    SUMMARY_CONCURRENCY_MAX: int = 100
+    KNOWLEDGE_CONCURRENCY_INITIAL: int = 3
+    KNOWLEDGE_CONCURRENCY_MIN: int = 1
+    KNOWLEDGE_CONCURRENCY_MAX: int = 6
+    # 종료 시 진행 중인 작업을 기다리는 최대 시간 (넘으면 취소) → 이후 공유 HTTP 클라이언트 / 청킹 풀 정리
+    WORKER_SHUTDOWN_DRAIN_TIMEOUT_SEC: float = 20.0
+
+    # 요약 배치 처리 : 큐에서 최대 SIZE 개 (또는 WAIT_MS 동안) 모아 한 번에 조회 / 요약 / 저장
+    SUMMARY_BATCH_ENABLED: bool = False
+    SUMMARY_BATCH_SIZE: int = 16
+    SUMMARY_BATCH_WAIT_MS: int = 200
+    # LLM 한 번에 넣을 답변 원문 길이 합 상한
+    SUMMARY_BATCH_MAX_CHARS: int = 12000
+
+    # 인라인 요약 : 답변 직후 같은 Worker 에서 메모리의 답변으로 바로 요약 (요약 큐 / 원문 재조회 생략)
+    # - 답변은 먼저 PENDING 으로 저장, 요약이 끝나면 UPDATE 로 COMPLETED, 시간 안에 끝나지 않으면 요약 큐로
+    CHAT_INLINE_SUMMARY_ENABLED: bool = False
+    CHAT_INLINE_SUMMARY_TIMEOUT_SEC: float = 15.0
+
+    # 하트비트 용량 정보 (cluster:capacity)
+    # - 루프 지연이 LIMIT 에 가까울수록 score 감소, STALE 초 이상 갱신 안 된 항목은 정리
+    HEARTBEAT_LOOP_LAG_LIMIT_SEC: float = 1.0
+    HEARTBEAT_CAPACITY_STALE_SEC: int = 30
+
+    # 이벤트 루프 지연 샘플링 / 느린 콜백 추적 (opt-in, 임계값 이상 멈추면 스택 캡처)
+    LOOP_LAG_SAMPLE_INTERVAL_SEC: float = 0.5
+    LOOP_SLOW_CALLBACK_TRACE_ENABLED: bool = False
+    LOOP_SLOW_CALLBACK_THRESHOLD_MS: int = 200
+    LOOP_SLOW_CALLBACK_STACK_DEPTH: int = 15
+
+    # /metrics 큐 길이 / 커넥션 풀 게이지 갱신 주기
+    METRICS_SAMPLE_INTERVAL_SEC: float = 5.0
+
+    # 지식 문서 청킹 (CPU 작업이라 프로세스 풀에서 실행, 0 이면 스레드)
+    CHUNKING_PROCESS_WORKERS: int = 1
+    CHUNK_SIZE: int = 1000
+    CHUNK_OVERLAP: int = 200
+    CHUNK_METADATA_PREVIEW_CHARS: int = 3000
+    # 헤더 없이 긴 본문은 이 길이마다 끊어서 청킹 (스트리밍 수집 시 메모리 상한)
+    CHUNK_MAX_SECTION_CHARS: int = 200_000
+    # MinIO 스트리밍 다운로드 조각 크기
+    MINIO_STREAM_CHUNK_BYTES: int = 1024 * 1024
+    # 지식 문서 수집 파이프라인 : 단계 사이 큐 크기(backpressure) / 동시 임베딩 단계 수
+    KNOWLEDGE_PIPELINE_QUEUE_SIZE: int = 4
+    KNOWLEDGE_PIPELINE_EMBED_WORKERS: int = 2
+
+    # 공유 HTTP 클라이언트 (OpenRouter / NestJS webhook), 커넥션 풀은 클라이언트별
+    HTTP_CLIENT_HTTP2: bool = True
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100
+    HTTP_CLIENT_MAX_KEEPALIVE: int = 20
+    HTTP_CLIENT_KEEPALIVE_EXPIRY_SEC: float = 30.0
+    HTTP_CLIENT_CONNECT_TIMEOUT_SEC: float = 5.0
+    # LLM 스트리밍은 토큰 사이 간격이 길 수 있어 넉넉하게
+    OPENROUTER_TIMEOUT_SEC: float = 120.0
+    WEBHOOK_TIMEOUT_SEC: float = 10.0
+
+    # 토큰 계산용 tiktoken 인코딩
+    TOKENIZER_ENCODING: str = "cl100k_base"
+
+    # 임베딩 배치 요청
+    EMBEDDING_BATCH_MAX_TOKENS: int = 8000
+    EMBEDDING_BATCH_MAX_INPUTS: int = 128
+    EMBEDDING_MAX_IN_FLIGHT: int = 4
+    # 입력 1개짜리 요청(채팅 질문 임베딩)만 쓰는 별도 슬롯 → 대량 적재 배치가 몰려도 질문 임베딩은 대기하지 않음
+    EMBEDDING_QUERY_MAX_IN_FLIGHT: int = 2
+    EMBEDDING_MAX_RETRIES: int = 5
+    EMBEDDING_BACKOFF_BASE_SEC: float = 0.5
+
+    # vectorized_docs.embedding ANN 인덱스 ("hnsw" | "ivfflat" | "none")
+    # HNSW 생성 실패 시(구버전 pgvector 등) IVFFlat 으로 대체
+    # 인덱스는 기동 후 백그라운드에서 CREATE INDEX CONCURRENTLY 로 생성 / 재생성
+    VECTOR_INDEX_TYPE: str = "hnsw"
+    VECTOR_HNSW_M: int = 16
+    VECTOR_HNSW_EF_CONSTRUCTION: int = 64
+    VECTOR_HNSW_EF_SEARCH: int = 40
+    VECTOR_IVFFLAT_LISTS: int = 100
+    VECTOR_IVFFLAT_PROBES: int = 10
+    # IVFFlat 생성 당시보다 행 수가 이 배수 이상 늘면 다음 기동 때 재생성 (중심점 갱신)
+    VECTOR_IVFFLAT_REBUILD_GROWTH: float = 2.0
+    # 필터 검색 시 후보가 부족하면 더 탐색 ("relaxed_order" | "strict_order", pgvector 0.8+ 에서만 설정)
+    VECTOR_HNSW_ITERATIVE_SCAN: str = ""
+    # 업로더별 부분 HNSW 인덱스를 만들 uploader_id 목록 (문서가 많은 테넌트)
+    VECTOR_PARTITIONED_UPLOADERS: list[str] = []
+
+    # RAG 검색 방식
+    # - vector : 코사인 거리만 사용 (기본값)
+    # - hybrid : 전문 검색(tsvector) + 벡터 검색을 동시에 실행하고 RRF(Reciprocal Rank Fusion)로 병합 (환경 변수로 활성화)
+    RAG_SEARCH_MODE: str = "vector"
+    RAG_HYBRID_CANDIDATES: int = 20
+    RAG_RRF_K: int = 60
+    # 재정렬 : 후보를 넉넉히 가져와 중복 청크 정리 + MMR 다양화 후 top_k 선택
+    RAG_RERANK_ENABLED: bool = False
+    RAG_RERANK_CANDIDATES: int = 30
+    # MMR 관련도 가중치 (1 이면 관련도만, 0 이면 다양성만)
+    RAG_MMR_LAMBDA: float = 0.7
+    # 이웃 청크가 이만큼 이상 겹쳐야 overlap 구간으로 보고 이어 붙임
+    RAG_DEDUP_MIN_OVERLAP_CHARS: int = 50
+    # 프롬프트에 넣을 RAG 문서 토큰 상한 (0 이면 제한 없음, 전체 예산은 CHAT_CONTEXT_TOKEN_BUDGET)
+    RAG_CONTEXT_TOKEN_BUDGET: int = 2000
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
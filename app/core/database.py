@@ -43,10 +43,16 @@ async def init_db():
         # 여기서 테이블을 만들어야 들어가는 구조다..! 
         from core.models import Message
         from core.vectorized_doc import VectorizedDoc
+        from core.semantic_cache_entry import SemanticCacheEntry
 
-        # 연결 시도 및 테이블 생성
+        from core.migrations import lock_migrations, run_migrations
+
+        # 연결 시도 및 테이블 생성 (Replica 끼리 동시에 DDL 을 실행하지 않도록 트랜잭션 단위 잠금)
+        # 오래 걸리는 인덱스 빌드 / 백필은 기동 후 run_index_migrations 에서 (잠금 / probe 시간에 묶이지 않도록)
         async with engine.begin() as conn:
+            await lock_migrations(conn)
             await conn.run_sync(Base.metadata.create_all)
+            await run_migrations(conn)
         logger.info("✅ PostgreSQL Connected & Tables Initialized!")
     except Exception as e:
         # 에러 발생 시 여기서 로그를 남기고, 필요하면 알림을 보냄
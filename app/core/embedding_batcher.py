@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import random
+import openai
+from core.config import settings
+from core.tokenizer import count_tokens
+
+logger = logging.getLogger("uvicorn")
+
+def is_retryable(e: Exception) -> bool:
+  """
+  429 / 5xx / 연결 오류만 재시도
+  """
+  if isinstance(e, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+    return True
+  if isinstance(e, openai.APIStatusError):
+    return e.status_code == 429 or e.status_code >= 500
+  return False
+
+def retry_after_seconds(e: Exception) -> float | None:
+  response = getattr(e, "response", None)
+  if response is None:
+    return None
+  try:
+    return float(response.headers.get("retry-after"))
+  except (TypeError, ValueError):
+    return None
+
+class EmbeddingBatcher:
+  """
+  임베딩 요청 배처
+  - 입력을 토큰 예산(max_batch_tokens) / 개수(max_batch_inputs) 기준으로 배치 분할
+  - 배치들은 max_in_flight 개까지 동시에 요청 (Pod 전체에서 공유하는 상한 → Provider 백프레셔)
+  - 입력 1개짜리 요청(채팅 질문)은 별도 슬롯(max_query_in_flight) 사용
+  - 배치별로 429/5xx 시 지수 백오프 재시도 후 입력 순서대로 재조립 (백오프 대기 중에는 슬롯 반납)
+  """
+
+  def __init__(
+    self,
+    max_batch_tokens: int = settings.EMBEDDING_BATCH_MAX_TOKENS,
+    max_batch_inputs: int = settings.EMBEDDING_BATCH_MAX_INPUTS,
+    max_in_flight: int = settings.EMBEDDING_MAX_IN_FLIGHT,
+    max_query_in_flight: int = settings.EMBEDDING_QUERY_MAX_IN_FLIGHT,
+    max_retries: int = settings.EMBEDDING_MAX_RETRIES,
+    backoff_base_sec: float = settings.EMBEDDING_BACKOFF_BASE_SEC,
+  ):
+    self.max_batch_tokens = max_batch_tokens
+    self.max_batch_inputs = max_batch_inputs
+    self.max_retries = max_retries
+    self.backoff_base_sec = backoff_base_sec
+    self._in_flight = asyncio.Semaphore(max_in_flight)
+    self._query_in_flight = asyncio.Semaphore(max_query_in_flight)
+
+  def make_batches(self, texts: list[str]) -> list[list[int]]:
+    """
+    입력 인덱스를 배치 단위로 묶음 (예산을 넘는 단일 입력은 단독 배치)
+    """
+    batches = []
+    current, current_tokens = [], 0
+
+    for idx, text in enumerate(texts):
+      tokens = count_tokens(text)
+      if current and (
+        current_tokens + tokens > self.max_batch_tokens
+        or len(current) >= self.max_batch_inputs
+      ):
+        batches.append(current)
+        current, current_tokens = [], 0
+      current.append(idx)
+      current_tokens += tokens
+
+    if current:
+      batches.append(current)
+    return batches
+
+  async def _request(self, gate: asyncio.Semaphore, client, model: str, texts: list[str]) -> list[list[float]]:
+    """
+    Provider 호출마다 슬롯을 잡고, 재시도 백오프 동안에는 반납 (throttle 된 배치가 다른 요청을 막지 않도록)
+    """
+    attempt = 0
+    while True:
+      try:
+        async with gate:
+          response = await client.embeddings.create(model=model, input=texts)
+        return [data.embedding for data in response.data]
+      except Exception as e:
+        if attempt >= self.max_retries or not is_retryable(e):
+          raise
+
+        delay = retry_after_seconds(e)
+        if delay is None:
+          delay = min(30.0, self.backoff_base_sec * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        attempt += 1
+        logger.warning(f"⚠️ Embedding batch retry {attempt}/{self.max_retries} in {delay:.2f}s: {e}")
+        await asyncio.sleep(delay)
+
+  async def embed(self, client, model: str, texts: list[str]) -> list[list[float]]:
+    """
+    texts 순서 그대로 벡터 리스트 반환 (하나라도 실패하면 나머지 배치 취소 후 예외 전파)
+    """
+    if not texts:
+      return []
+
+    # SDK 자체 재시도는 끄고 배치 단위 백오프로만 재시도
+    client = client.with_options(max_retries=0)
+    batches = self.make_batches(texts)
+
+    # 질문 임베딩(입력 1개)은 별도 슬롯, 나머지는 단일 배치도 같은 max_in_flight 상한 안에서 요청
+    if len(texts) == 1:
+      return await self._request(self._query_in_flight, client, model, texts)
+    if len(batches) == 1:
+      return await self._request(self._in_flight, client, model, texts)
+
+    logger.info(f"🧮 Embedding {len(texts)} inputs in {len(batches)} batches")
+
+    tasks = [
+      asyncio.create_task(self._request(self._in_flight, client, model, [texts[i] for i in batch]))
+      for batch in batches
+    ]
+    try:
+      results = await asyncio.gather(*tasks)
+    except BaseException:
+      for task in tasks:
+        task.cancel()
+      raise
+
+    vectors: list[list[float] | None] = [None] * len(texts)
+    for batch, batch_vectors in zip(batches, results):
+      for idx, vector in zip(batch, batch_vectors):
+        vectors[idx] = vector
+    return vectors
+
+embedding_batcher = EmbeddingBatcher()
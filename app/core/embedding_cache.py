@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import unicodedata
+from array import array
+from collections import OrderedDict
+from core.config import settings
+from core.redis import get_binary_redis_client
+
+logger = logging.getLogger("uvicorn")
+
+def normalize_text(text: str) -> str:
+  """
+  캐시 키용 정규화 (유니코드 NFKC + 공백 정리)
+  """
+  return " ".join(unicodedata.normalize("NFKC", text).split())
+
+def pack_vector(vector: list[float]) -> bytes:
+  return array("f", vector).tobytes()
+
+def unpack_vector(raw: bytes) -> list[float]:
+  vector = array("f")
+  vector.frombytes(raw)
+  return vector.tolist()
+
+class EmbeddingCache:
+  """
+  임베딩 캐시 (2단계)
+  - 1단계 : 프로세스 내 LRU (packed float32 bytes 로 보관하여 메모리 절약)
+  - 2단계 : Redis (Pod 간 공유, TTL 적용)
+  - 키 : emb:{모델명}:{정규화된 텍스트의 SHA-256}
+  """
+
+  def __init__(
+    self,
+    local_size: int = settings.EMBEDDING_CACHE_LOCAL_SIZE,
+    ttl_sec: int = settings.EMBEDDING_CACHE_TTL_SEC,
+    enabled: bool = settings.EMBEDDING_CACHE_ENABLED,
+  ):
+    self.local_size = local_size
+    self.ttl_sec = ttl_sec
+    self.enabled = enabled
+    self._local: OrderedDict[str, bytes] = OrderedDict()
+    self.redis_client = get_binary_redis_client()
+
+  @staticmethod
+  def make_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"emb:{model}:{digest}"
+
+  def _local_get(self, key: str) -> bytes | None:
+    raw = self._local.get(key)
+    if raw is not None:
+      self._local.move_to_end(key)
+    return raw
+
+  def _local_set(self, key: str, raw: bytes):
+    self._local[key] = raw
+    self._local.move_to_end(key)
+    while len(self._local) > self.local_size:
+      self._local.popitem(last=False)
+
+  async def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+    """
+    texts 순서대로 캐시된 벡터 반환 (없으면 None)
+    """
+    if not self.enabled:
+      return [None] * len(texts)
+
+    keys = [self.make_key(model, text) for text in texts]
+    results: list[bytes | None] = [self._local_get(key) for key in keys]
+
+    missing_idx = [i for i, raw in enumerate(results) if raw is None]
+    if missing_idx:
+      try:
+        remote = await self.redis_client.mget([keys[i] for i in missing_idx])
+        for i, raw in zip(missing_idx, remote):
+          if raw is not None:
+            results[i] = raw
+            self._local_set(keys[i], raw)
+      except Exception as e:
+        # 캐시 장애는 임베딩 생성을 막지 않음
+        logger.warning(f"⚠️ Embedding cache read failed: {e}")
+
+    return [unpack_vector(raw) if raw is not None else None for raw in results]
+
+  async def set_many(self, model: str, items: dict[str, list[float]]):
+    """
+    {텍스트: 벡터} 를 두 단계 캐시에 저장
+    """
+    if not self.enabled or not items:
+      return
+
+    pipe = self.redis_client.pipeline(transaction=False)
+    for text, vector in items.items():
+      key = self.make_key(model, text)
+      raw = pack_vector(vector)
+      self._local_set(key, raw)
+      pipe.set(key, raw, ex=self.ttl_sec)
+
+    try:
+      await pipe.execute()
+    except Exception as e:
+      logger.warning(f"⚠️ Embedding cache write failed: {e}")
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,114 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+from core.config import settings
+from core.redis import get_redis_client
+from core.models import Message
+
+logger = logging.getLogger("uvicorn")
+
+redis_client = get_redis_client()
+
+# 리스트에서 id 가 같은 항목을 찾아 교체 (요약 완료 시 사용)
+REPLACE_BY_ID_SCRIPT = redis_client.register_script("""
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+for i, raw in ipairs(items) do
+  local msg = cjson.decode(raw)
+  if msg['id'] == ARGV[1] then
+    redis.call('LSET', KEYS[1], i - 1, ARGV[2])
+    return 1
+  end
+end
+return 0
+""")
+
+def history_key(session_id: str) -> str:
+  return f"chat:history:{session_id}"
+
+def serialize_message(message: Message) -> str:
+  return json.dumps({
+    "id": str(message.id),
+    "user_uuid": str(message.user_uuid),
+    "session_id": message.session_id,
+    "role": message.role,
+    "content_full": message.content_full,
+    "content_summary": message.content_summary,
+    "status": message.status,
+    "created_at": message.created_at.isoformat() if message.created_at else None,
+  }, ensure_ascii=False)
+
+def deserialize_message(raw: str) -> Message:
+  """
+  캐시 항목 → 세션에 붙지 않은(transient) Message 객체
+  """
+  data = json.loads(raw)
+  return Message(
+    id=uuid.UUID(data["id"]),
+    user_uuid=uuid.UUID(data["user_uuid"]),
+    session_id=data["session_id"],
+    role=data["role"],
+    content_full=data["content_full"],
+    content_summary=data["content_summary"],
+    status=data["status"],
+    created_at=datetime.fromisoformat(data["created_at"]) if data["created_at"] else None,
+  )
+
+async def append_message(message: Message):
+  """
+  Write-through : 캐시가 있을 때만 뒤에 추가 (RPUSHX)
+  - 캐시가 없으면 다음 조회 때 DB 에서 채우므로 부분 리스트를 만들지 않음
+  """
+  key = history_key(message.session_id)
+  try:
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.rpushx(key, serialize_message(message))
+    pipe.ltrim(key, -settings.CHAT_HISTORY_CACHE_SIZE, -1)
+    pipe.expire(key, settings.CHAT_HISTORY_CACHE_TTL_SEC)
+    await pipe.execute()
+  except Exception as e:
+    logger.warning(f"⚠️ History cache append failed ({message.session_id}): {e}")
+
+async def replace_message(message: Message):
+  """
+  Write-through : 캐시에 있는 같은 id 항목을 교체 (요약 반영)
+  """
+  try:
+    await REPLACE_BY_ID_SCRIPT(
+      keys=[history_key(message.session_id)],
+      args=[str(message.id), serialize_message(message)],
+    )
+  except Exception as e:
+    logger.warning(f"⚠️ History cache update failed ({message.session_id}): {e}")
+
+async def load_messages(session_id: str) -> list[Message] | None:
+  """
+  캐시된 최근 메시지 (오래된 순), 캐시가 없으면 None
+  """
+  try:
+    raws = await redis_client.lrange(history_key(session_id), 0, -1)
+  except Exception as e:
+    logger.warning(f"⚠️ History cache read failed ({session_id}): {e}")
+    return None
+
+  if not raws:
+    return None
+  return [deserialize_message(raw) for raw in raws]
+
+async def fill_messages(session_id: str, messages: list[Message]):
+  """
+  캐시 미스 시 DB 에서 읽은 최근 메시지로 캐시를 새로 채움
+  """
+  if not messages:
+    return
+
+  key = history_key(session_id)
+  try:
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(key)
+    pipe.rpush(key, *[serialize_message(message) for message in messages])
+    pipe.ltrim(key, -settings.CHAT_HISTORY_CACHE_SIZE, -1)
+    pipe.expire(key, settings.CHAT_HISTORY_CACHE_TTL_SEC)
+    await pipe.execute()
+  except Exception as e:
+    logger.warning(f"⚠️ History cache fill failed ({session_id}): {e}")
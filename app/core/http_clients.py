@@ -0,0 +1,91 @@
+import logging
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from core.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+def build_limits() -> httpx.Limits:
+  return httpx.Limits(
+    max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE,
+    keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY_SEC,
+  )
+
+class ClientRegistry:
+  """
+  프로세스 전체가 함께 쓰는 외부 HTTP 클라이언트 (lifespan 에서 열고 닫음)
+  - openai : OpenRouter (채팅 / 요약 / 메타데이터 추출 / 임베딩)
+  - webhook : NestJS 내부 API
+  - HTTP/2 + keep-alive 커넥션 풀 재사용 → 요청마다 TCP / TLS 핸드셰이크 X
+  - lifespan 밖(스크립트 등)에서도 쓸 수 있도록 처음 접근할 때 생성
+  - aclose 이후 접근은 에러 (닫히지 않는 클라이언트가 새로 생기지 않도록)
+  """
+
+  def __init__(self):
+    self._openai: AsyncOpenAI | None = None
+    self._webhook: httpx.AsyncClient | None = None
+    self._closed = False
+
+  def _ensure_open(self):
+    if self._closed:
+      raise RuntimeError("Shared HTTP clients are already closed")
+
+  @property
+  def openai(self) -> AsyncOpenAI:
+    self._ensure_open()
+    if self._openai is None:
+      self._openai = AsyncOpenAI(
+        api_key=settings.OPENROUTER_API_KEY,
+        base_url=OPENROUTER_BASE_URL,
+        default_headers={
+          "HTTP-Referer": settings.SITE_URL,
+          "X-Title": settings.SITE_NAME,
+        },
+        http_client=DefaultAsyncHttpxClient(
+          http2=settings.HTTP_CLIENT_HTTP2,
+          limits=build_limits(),
+          timeout=httpx.Timeout(
+            settings.OPENROUTER_TIMEOUT_SEC,
+            connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT_SEC,
+          ),
+        ),
+      )
+    return self._openai
+
+  @property
+  def webhook(self) -> httpx.AsyncClient:
+    self._ensure_open()
+    if self._webhook is None:
+      self._webhook = httpx.AsyncClient(
+        http2=settings.HTTP_CLIENT_HTTP2,
+        limits=build_limits(),
+        timeout=httpx.Timeout(
+          settings.WEBHOOK_TIMEOUT_SEC,
+          connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT_SEC,
+        ),
+      )
+    return self._webhook
+
+  def open(self):
+    """
+    lifespan 시작 시 미리 생성 (첫 요청이 클라이언트 생성 비용을 떠안지 않도록)
+    """
+    self._closed = False
+    self.openai
+    self.webhook
+    logger.info(f"✅ Shared HTTP clients ready (http2={settings.HTTP_CLIENT_HTTP2})")
+
+  async def aclose(self):
+    self._closed = True
+    if self._openai is not None:
+      await self._openai.close()
+      self._openai = None
+    if self._webhook is not None:
+      await self._webhook.aclose()
+      self._webhook = None
+    logger.info("🛑 Shared HTTP clients closed.")
+
+clients = ClientRegistry()
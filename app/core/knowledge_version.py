@@ -0,0 +1,13 @@
+from core.redis import get_redis_client
+
+# 지식 베이스(vectorized_docs) 내용이 바뀔 때마다 증가하는 버전
+KNOWLEDGE_VERSION_KEY = "knowledge:version"
+
+async def get_knowledge_version() -> int:
+  redis_client = get_redis_client()
+  value = await redis_client.get(KNOWLEDGE_VERSION_KEY)
+  return int(value) if value else 0
+
+async def bump_knowledge_version() -> int:
+  redis_client = get_redis_client()
+  return await redis_client.incr(KNOWLEDGE_VERSION_KEY)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from core.config import settings
+from core.metrics import EVENT_LOOP_LAG_SECONDS, SLOW_CALLBACKS
+
+logger = logging.getLogger("uvicorn")
+
+def job_task_name(job_type: str, job_id) -> str:
+  """
+  작업 Task 이름 규칙 (느린 콜백 추적 시 어떤 작업인지 식별)
+  """
+  return f"{job_type}:{job_id}"
+
+def parse_task_name(task: asyncio.Task | None) -> tuple[str, str | None]:
+  """
+  Task 이름 → (작업 종류, 작업 id), 작업 Task 가 아니면 ("other", 이름)
+  """
+  if task is None:
+    return "none", None
+  name = task.get_name()
+  job_type, sep, job_id = name.partition(":")
+  if sep and job_type in ("chat", "summary", "knowledge"):
+    return job_type, job_id
+  return "other", name
+
+class LoopMonitor:
+  """
+  이벤트 루프 지연 측정 + (opt-in) 느린 콜백 추적
+  - 샘플러 : 루프 안에서 짧게 sleep 하고 늦게 깨어난 만큼을 지연으로 기록
+  - 추적기 : 별도 스레드가 샘플러의 마지막 tick 을 감시, 임계값 이상 멈춰 있으면
+             그 순간 루프 스레드의 스택과 실행 중인 Task(작업 종류/id)를 캡처
+  """
+
+  def __init__(
+    self,
+    interval_sec: float = settings.LOOP_LAG_SAMPLE_INTERVAL_SEC,
+    threshold_ms: int = settings.LOOP_SLOW_CALLBACK_THRESHOLD_MS,
+    trace_enabled: bool = settings.LOOP_SLOW_CALLBACK_TRACE_ENABLED,
+  ):
+    self.interval_sec = interval_sec
+    self.threshold_sec = threshold_ms / 1000
+    self.trace_enabled = trace_enabled
+
+    self._loop: asyncio.AbstractEventLoop | None = None
+    self._loop_thread_id: int | None = None
+    self._last_tick = time.monotonic()
+    self._max_lag = 0.0
+    self._stop = threading.Event()
+    self._thread: threading.Thread | None = None
+
+  def pop_max_lag(self) -> float:
+    """
+    마지막 호출 이후 가장 큰 루프 지연 (하트비트에서 사용)
+    """
+    lag, self._max_lag = self._max_lag, 0.0
+    return lag
+
+  async def run(self):
+    self._loop = asyncio.get_running_loop()
+    self._loop_thread_id = threading.get_ident()
+    self._last_tick = time.monotonic()
+
+    if self.trace_enabled:
+      self._stop.clear()
+      self._thread = threading.Thread(target=self._watch, name="loop-slow-callback-tracer", daemon=True)
+      self._thread.start()
+      logger.info(f"🔬 Slow callback tracer enabled (> {self.threshold_sec * 1000:.0f}ms)")
+
+    try:
+      while True:
+        slept_from = time.monotonic()
+        await asyncio.sleep(self.interval_sec)
+        now = time.monotonic()
+        self._last_tick = now
+
+        lag = max(0.0, now - slept_from - self.interval_sec)
+        self._max_lag = max(self._max_lag, lag)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+    except asyncio.CancelledError:
+      logger.info("🛑 Loop monitor cancelled.")
+    finally:
+      self._stop.set()
+
+  def _watch(self):
+    """
+    추적 스레드 : 루프가 멈춘 동안 한 번만 캡처
+    """
+    reported_tick = None
+    poll = max(self.threshold_sec / 4, 0.01)
+
+    while not self._stop.wait(poll):
+      last_tick = self._last_tick
+      blocked = time.monotonic() - last_tick - self.interval_sec
+      if blocked < self.threshold_sec or reported_tick == last_tick:
+        continue
+
+      reported_tick = last_tick
+      try:
+        self._report(blocked)
+      except Exception as e:
+        logger.warning(f"⚠️ Slow callback capture failed: {e}")
+
+  def _report(self, blocked: float):
+    frame = sys._current_frames().get(self._loop_thread_id)
+    stack = traceback.format_stack(frame, limit=settings.LOOP_SLOW_CALLBACK_STACK_DEPTH) if frame else []
+
+    # 루프 스레드가 멈춰 있으므로 실행 중인 Task 는 바뀌지 않음
+    task = asyncio.tasks._current_tasks.get(self._loop)
+    job_type, job_id = parse_task_name(task)
+
+    SLOW_CALLBACKS.labels(job=job_type).inc()
+    logger.warning(json.dumps({
+      "level": "warn",
+      "event": "slow_callback",
+      "job_type": job_type,
+      "job_id": job_id,
+      "blocked_ms": round(blocked * 1000, 1),
+      "stack": [line.strip() for line in stack],
+    }, ensure_ascii=False))
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+from core.config import settings
+from core.concurrency import limiters
+from core.database import engine
+from core.redis import get_redis_client, pool as redis_pool, binary_pool as redis_binary_pool
+
+logger = logging.getLogger("uvicorn")
+
+# LLM 호출이 포함된 단계가 많아서 기본 버킷보다 길게 잡음
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+JOB_STAGE_SECONDS = Histogram(
+  "protostar_job_stage_seconds",
+  "Latency of each stage of a queue job",
+  ["job", "stage"],
+  buckets=STAGE_BUCKETS,
+)
+
+CHAT_TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+  "protostar_chat_time_to_first_token_seconds",
+  "Time from LLM request to the first streamed token",
+  buckets=STAGE_BUCKETS,
+)
+
+DLQ_EVENTS = Counter(
+  "protostar_dlq_events_total",
+  "Jobs that failed and were dead-lettered (logged as DLQ)",
+  ["job"],
+)
+
+JOBS_IN_FLIGHT = Gauge("protostar_jobs_in_flight", "Jobs currently running", ["job"])
+CONCURRENCY_LIMIT = Gauge("protostar_concurrency_limit", "Current adaptive concurrency limit", ["job"])
+JOBS_WAITING = Gauge("protostar_jobs_waiting_for_slot", "Intake loops waiting for a free slot", ["job"])
+
+EVENT_LOOP_LAG_SECONDS = Histogram(
+  "protostar_event_loop_lag_seconds",
+  "How late the event loop woke up from a short sleep",
+  buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+SLOW_CALLBACKS = Counter(
+  "protostar_slow_callbacks_total",
+  "Event loop stalls above the tracer threshold, by the job running at the time",
+  ["job"],
+)
+
+QUEUE_DEPTH = Gauge("protostar_queue_depth", "Pending items in a Redis job queue", ["queue"])
+
+DB_POOL_CONNECTIONS = Gauge("protostar_db_pool_connections", "SQLAlchemy connection pool usage", ["state"])
+REDIS_POOL_CONNECTIONS = Gauge("protostar_redis_pool_connections", "Redis connection pool usage", ["pool", "state"])
+
+# 리스트 기반 큐 (LLEN)
+LIST_QUEUES = ("chat:job:queue", "chat:summary:queue", "ai:job:queue")
+
+@contextmanager
+def track_stage(job: str, stage: str):
+  """
+  with 블록 실행 시간을 단계별 히스토그램에 기록 (예외가 나도 기록)
+  """
+  started_at = time.perf_counter()
+  try:
+    yield
+  finally:
+    JOB_STAGE_SECONDS.labels(job=job, stage=stage).observe(time.perf_counter() - started_at)
+
+def sample_pools():
+  """
+  DB / Redis 커넥션 풀 사용량
+  """
+  db_pool = engine.pool
+  try:
+    DB_POOL_CONNECTIONS.labels(state="checked_out").set(db_pool.checkedout())
+    DB_POOL_CONNECTIONS.labels(state="idle").set(db_pool.checkedin())
+    DB_POOL_CONNECTIONS.labels(state="capacity").set(db_pool.size() + getattr(db_pool, "_max_overflow", 0))
+  except Exception:
+    pass
+
+  for name, connection_pool in (("text", redis_pool), ("binary", redis_binary_pool)):
+    REDIS_POOL_CONNECTIONS.labels(pool=name, state="in_use").set(len(connection_pool._in_use_connections))
+    REDIS_POOL_CONNECTIONS.labels(pool=name, state="idle").set(len(connection_pool._available_connections))
+    REDIS_POOL_CONNECTIONS.labels(pool=name, state="max").set(connection_pool.max_connections)
+
+def sample_limiters():
+  for name, limiter in limiters.items():
+    snapshot = limiter.snapshot()
+    JOBS_IN_FLIGHT.labels(job=name).set(snapshot["in_flight"])
+    CONCURRENCY_LIMIT.labels(job=name).set(snapshot["limit"])
+    JOBS_WAITING.labels(job=name).set(snapshot["waiting"])
+
+async def sample_queues(redis_client):
+  pipe = redis_client.pipeline(transaction=False)
+  for queue in LIST_QUEUES:
+    pipe.llen(queue)
+  depths = await pipe.execute()
+
+  for queue, depth in zip(LIST_QUEUES, depths):
+    QUEUE_DEPTH.labels(queue=queue).set(depth)
+
+  if settings.CHAT_JOB_INTAKE == "stream":
+    try:
+      groups = await redis_client.xinfo_groups(settings.CHAT_JOB_STREAM)
+      for group in groups:
+        if group["name"] == settings.CHAT_JOB_GROUP:
+          # 아직 읽지 않은 항목(lag) + 읽었지만 ACK 안 된 항목(pending)
+          QUEUE_DEPTH.labels(queue=settings.CHAT_JOB_STREAM).set((group.get("lag") or 0) + group["pending"])
+    except Exception:
+      # 스트림 / 그룹이 아직 없음
+      pass
+
+async def run_metrics_sampler():
+  """
+  스크랩과 별개로 주기적으로 큐 길이 / 풀 / 동시성 게이지 갱신
+  """
+  redis_client = get_redis_client()
+  try:
+    while True:
+      try:
+        sample_pools()
+        sample_limiters()
+        await sample_queues(redis_client)
+      except Exception as e:
+        logger.warning(f"⚠️ Metrics sampling failed: {e}")
+
+      await asyncio.sleep(settings.METRICS_SAMPLE_INTERVAL_SEC)
+  except asyncio.CancelledError:
+    logger.info("🛑 Metrics sampler cancelled.")
+  finally:
+    await redis_client.close()
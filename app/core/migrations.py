@@ -0,0 +1,333 @@
+import asyncio
+import hashlib
+import logging
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from core.config import settings
+from core.database import engine
+
+logger = logging.getLogger("uvicorn")
+
+HNSW_INDEX_NAME = "idx_vectorized_docs_embedding_hnsw"
+IVFFLAT_INDEX_NAME = "idx_vectorized_docs_embedding_ivfflat"
+UPLOADER_HNSW_INDEX_PREFIX = "idx_vectorized_docs_embedding_hnsw_u_"
+SEMANTIC_CACHE_HNSW_INDEX_NAME = "idx_semantic_cache_embedding_hnsw"
+SEMANTIC_CACHE_IVFFLAT_INDEX_NAME = "idx_semantic_cache_embedding_ivfflat"
+# 여러 Replica 가 동시에 기동할 때 스키마 작업을 한 번에 하나씩 실행하기 위한 advisory lock 키
+MIGRATION_LOCK_KEY = 7_413_201_001
+# 인덱스 빌드 / 백필은 한 인스턴스만 실행 (나머지는 기다리지 않고 건너뜀)
+INDEX_MIGRATION_LOCK_KEY = 7_413_201_002
+CONTENT_TSV_BACKFILL_BATCH = 1000
+
+async def lock_migrations(conn: AsyncConnection):
+  """
+  트랜잭션이 끝날 때까지 다른 인스턴스의 스키마 작업을 막음 (pg_advisory_xact_lock)
+  - 뒤에 온 인스턴스는 앞 인스턴스가 커밋한 뒤의 상태를 보고 필요 없는 DDL 은 건너뜀
+  """
+  await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+async def get_index_state(conn: AsyncConnection, index_name: str) -> dict | None:
+  """
+  인덱스의 WITH (...) 옵션 / 유효 여부 / COMMENT 조회 (인덱스가 없으면 None)
+  - CONCURRENTLY 빌드가 중간에 끊기면 valid=False 인 인덱스가 남음
+  """
+  result = await conn.execute(
+    text(
+      "SELECT c.reloptions, i.indisvalid, obj_description(c.oid, 'pg_class') "
+      "FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name"
+    ),
+    {"name": index_name},
+  )
+  row = result.first()
+  if row is None:
+    return None
+  return {"options": set(row[0] or []), "valid": row[1], "comment": row[2]}
+
+async def create_index_concurrently(conn: AsyncConnection, index_name: str, definition: str) -> bool:
+  """
+  CREATE INDEX CONCURRENTLY (autocommit 연결 필요, 빌드 중에도 쓰기를 막지 않음)
+  - 유효한 인덱스가 이미 있으면 건너뜀, INVALID 로 남은 인덱스는 지우고 다시 생성
+  - 생성했으면 True
+  """
+  state = await get_index_state(conn, index_name)
+  if state is not None and state["valid"]:
+    return False
+
+  if state is not None:
+    logger.warning(f"⚠️ Dropping invalid index left by an interrupted build: {index_name}")
+    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+
+  await conn.execute(text(f"CREATE INDEX CONCURRENTLY {index_name} {definition}"))
+  return True
+
+async def ensure_index(
+  conn: AsyncConnection,
+  index_name: str,
+  method: str,
+  options: dict,
+  where: str = None,
+  table: str = "vectorized_docs",
+  force: bool = False,
+) -> bool:
+  """
+  embedding 인덱스를 원하는 옵션으로 유지 (CONCURRENTLY, autocommit 연결 필요)
+  - 없으면 생성
+  - 옵션이 바뀌었거나 INVALID 이거나 force 면 새 이름으로 만든 뒤 교체 (재생성 동안에도 기존 인덱스로 검색)
+  - where 가 있으면 부분 인덱스
+  - 생성했으면 True
+  """
+  expected = {f"{key}={value}" for key, value in options.items()}
+  state = await get_index_state(conn, index_name)
+
+  if state is not None and state["valid"] and state["options"] == expected and not force:
+    return False
+
+  with_clause = ", ".join(f"{key} = {int(value)}" for key, value in options.items())
+  where_clause = f" WHERE {where}" if where else ""
+  definition = f"ON {table} USING {method} (embedding vector_cosine_ops) WITH ({with_clause}){where_clause}"
+
+  if state is None:
+    await conn.execute(text(f"CREATE INDEX CONCURRENTLY {index_name} {definition}"))
+    return True
+
+  logger.info(f"🔧 Rebuilding {index_name}: {sorted(state['options'])} -> {sorted(expected)}")
+  rebuild_name = f"{index_name}_rebuild"
+  await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {rebuild_name}"))
+  await conn.execute(text(f"CREATE INDEX CONCURRENTLY {rebuild_name} {definition}"))
+  await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+  await conn.execute(text(f"ALTER INDEX {rebuild_name} RENAME TO {index_name}"))
+  return True
+
+async def ensure_ivfflat_index(conn: AsyncConnection, index_name: str, table: str = "vectorized_docs") -> bool:
+  """
+  IVFFlat 인덱스 관리 (중심점(lists)을 생성 시점의 데이터로 정하므로)
+  - 빈 테이블에는 만들지 않음 → 데이터가 쌓인 뒤 다음 기동 때 생성
+  - 생성 당시 행 수를 인덱스 COMMENT 에 기록, VECTOR_IVFFLAT_REBUILD_GROWTH 배 이상 늘면 재생성
+  - 생성했으면 True
+  """
+  rows = (await conn.execute(text(f"SELECT count(*) FROM {table} WHERE embedding IS NOT NULL"))).scalar()
+  if rows == 0:
+    logger.info(f"⏭️ {table} is empty, deferring IVFFlat index {index_name}")
+    return False
+
+  state = await get_index_state(conn, index_name)
+  built_rows = None
+  if state is not None and (state["comment"] or "").startswith("rows="):
+    built_rows = int(state["comment"].removeprefix("rows="))
+
+  # 행 수 기록이 없는 기존 인덱스도 한 번 다시 만듦 (빈 테이블에서 만들어졌을 수 있음)
+  force = state is not None and (built_rows is None or rows >= built_rows * settings.VECTOR_IVFFLAT_REBUILD_GROWTH)
+  created = await ensure_index(conn, index_name, "ivfflat", {"lists": settings.VECTOR_IVFFLAT_LISTS}, table=table, force=force)
+  if created:
+    await conn.execute(text(f"COMMENT ON INDEX {index_name} IS 'rows={int(rows)}'"))
+  return created
+
+async def ensure_vector_index(
+  conn: AsyncConnection,
+  table: str = "vectorized_docs",
+  hnsw_name: str = HNSW_INDEX_NAME,
+  ivfflat_name: str = IVFFLAT_INDEX_NAME,
+  index_type: str = None,
+):
+  """
+  embedding ANN 인덱스 관리 (기본 : vectorized_docs, VECTOR_INDEX_TYPE 기준)
+  - hnsw : m / ef_construction 적용, pgvector 가 hnsw 를 지원하지 않을 때만 ivfflat 으로 대체
+  - ivfflat : lists 적용 (ensure_ivfflat_index)
+  - none : 인덱스 없음
+  - 선택되지 않은 종류의 인덱스는 제거 (대체한 경우에는 기존 인덱스를 건드리지 않음)
+  """
+  index_type = index_type or settings.VECTOR_INDEX_TYPE
+  fell_back = False
+
+  if index_type == "hnsw":
+    try:
+      created = await ensure_index(conn, hnsw_name, "hnsw", {
+        "m": settings.VECTOR_HNSW_M,
+        "ef_construction": settings.VECTOR_HNSW_EF_CONSTRUCTION,
+      }, table=table)
+      if created:
+        logger.info(f"✅ HNSW index ready: {hnsw_name}")
+    except Exception as e:
+      # 락 / 이름 충돌 등 다른 에러는 그대로 전달 (잘못 대체하면 HNSW 가 사라진 채 복구되지 않음)
+      if 'access method "hnsw" does not exist' not in str(e):
+        raise
+      logger.warning(f"⚠️ HNSW index unavailable, falling back to IVFFlat: {e}")
+      index_type = "ivfflat"
+      fell_back = True
+
+  if index_type == "ivfflat":
+    if await ensure_ivfflat_index(conn, ivfflat_name, table=table):
+      logger.info(f"✅ IVFFlat index ready: {ivfflat_name}")
+
+  if fell_back:
+    return
+
+  for name, kind in ((hnsw_name, "hnsw"), (ivfflat_name, "ivfflat")):
+    if kind != index_type:
+      await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+async def ensure_semantic_cache_index(conn: AsyncConnection):
+  """
+  semantic_cache.embedding ANN 인덱스 (ensure_vector_index 와 같은 HNSW → IVFFlat 대체 규칙)
+  - SEMANTIC_CACHE_ENABLED=false 면 만들지 않고, 있던 인덱스는 제거
+  """
+  index_type = settings.VECTOR_INDEX_TYPE if settings.SEMANTIC_CACHE_ENABLED else "none"
+  await ensure_vector_index(
+    conn,
+    table="semantic_cache",
+    hnsw_name=SEMANTIC_CACHE_HNSW_INDEX_NAME,
+    ivfflat_name=SEMANTIC_CACHE_IVFFLAT_INDEX_NAME,
+    index_type=index_type,
+  )
+
+async def add_content_hash_column(conn: AsyncConnection):
+  """
+  vectorized_docs.content_hash (기존 테이블에는 create_all 이 컬럼을 추가하지 않음)
+  - NULL 허용 컬럼 추가는 테이블 재작성 없이 카탈로그만 변경
+  - 기존 행은 NULL → 다음 재업로드 때 stale 로 정리됨
+  """
+  await conn.execute(text("ALTER TABLE vectorized_docs ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"))
+
+async def add_content_tsv_column(conn: AsyncConnection):
+  """
+  vectorized_docs.content_tsv (하이브리드 검색용) + 값을 채우는 트리거
+  - generated column(STORED) 추가는 테이블 전체를 재작성하므로 일반 컬럼 + 트리거로 관리
+  - 기존 행은 backfill_content_tsv 가 기동 후 나눠서 채움
+  - 예전 방식으로 이미 generated column 인 경우는 그대로 둠
+  """
+  await conn.execute(text("ALTER TABLE vectorized_docs ADD COLUMN IF NOT EXISTS content_tsv tsvector"))
+
+  generated = (await conn.execute(text(
+    "SELECT attgenerated = 's' FROM pg_attribute "
+    "WHERE attrelid = 'vectorized_docs'::regclass AND attname = 'content_tsv'"
+  ))).scalar()
+  if generated:
+    return
+
+  await conn.execute(text(
+    "CREATE OR REPLACE FUNCTION vectorized_docs_content_tsv() RETURNS trigger LANGUAGE plpgsql AS $$ "
+    "BEGIN NEW.content_tsv := to_tsvector('simple', NEW.content); RETURN NEW; END $$"
+  ))
+  exists = (await conn.execute(text(
+    "SELECT 1 FROM pg_trigger "
+    "WHERE tgrelid = 'vectorized_docs'::regclass AND tgname = 'trg_vectorized_docs_content_tsv'"
+  ))).first()
+  if exists is None:
+    await conn.execute(text(
+      "CREATE TRIGGER trg_vectorized_docs_content_tsv "
+      "BEFORE INSERT OR UPDATE OF content ON vectorized_docs "
+      "FOR EACH ROW EXECUTE FUNCTION vectorized_docs_content_tsv()"
+    ))
+
+async def backfill_content_tsv(conn: AsyncConnection):
+  """
+  content_tsv 가 비어 있는 기존 행을 CONTENT_TSV_BACKFILL_BATCH 개씩 채움 (autocommit, 배치마다 커밋)
+  - PK 순서로 훑으므로 배치마다 테이블 전체를 스캔하지 않음
+  """
+  missing = (await conn.execute(text("SELECT 1 FROM vectorized_docs WHERE content_tsv IS NULL LIMIT 1"))).first()
+  if missing is None:
+    return
+
+  logger.info("🔧 Backfilling vectorized_docs.content_tsv...")
+  last_id, total = "", 0
+  while True:
+    ids = (await conn.execute(
+      text("SELECT id FROM vectorized_docs WHERE id > :after ORDER BY id LIMIT :size"),
+      {"after": last_id, "size": CONTENT_TSV_BACKFILL_BATCH},
+    )).scalars().all()
+    if not ids:
+      break
+
+    result = await conn.execute(
+      text(
+        "UPDATE vectorized_docs SET content_tsv = to_tsvector('simple', content) "
+        "WHERE id = ANY(:ids) AND content_tsv IS NULL"
+      ),
+      {"ids": list(ids)},
+    )
+    total += result.rowcount
+    last_id = ids[-1]
+
+  logger.info(f"✅ content_tsv backfilled: {total} rows")
+
+async def add_search_indexes(conn: AsyncConnection):
+  """
+  비교 / 전문 검색 / 검색 범위 필터용 인덱스 (기존 테이블에는 create_all 이 인덱스를 추가하지 않음)
+  """
+  await create_index_concurrently(conn, "idx_vectorized_docs_doc_hash", "ON vectorized_docs (knowledge_doc_id, content_hash)")
+  await create_index_concurrently(conn, "idx_vectorized_docs_content_tsv", "ON vectorized_docs USING gin (content_tsv)")
+  await create_index_concurrently(conn, "idx_vectorized_docs_uploader", "ON vectorized_docs (uploader_id)")
+  await create_index_concurrently(conn, "idx_vectorized_docs_meta", "ON vectorized_docs USING gin (meta_data jsonb_path_ops)")
+
+def uploader_index_name(uploader_id: str) -> str:
+  return UPLOADER_HNSW_INDEX_PREFIX + hashlib.md5(uploader_id.encode("utf-8")).hexdigest()[:12]
+
+async def ensure_uploader_vector_indexes(conn: AsyncConnection):
+  """
+  VECTOR_PARTITIONED_UPLOADERS 업로더별 부분 HNSW 인덱스
+  - 업로더 필터 검색이 전체 그래프를 돌며 후처리 필터링하지 않고 해당 업로더 그래프만 탐색
+  - 목록에서 빠진 업로더의 인덱스(중단된 재생성의 _rebuild 인덱스 포함)는 제거
+  """
+  expected = {}
+  if settings.VECTOR_INDEX_TYPE == "hnsw":
+    expected = {uploader_index_name(uploader_id): uploader_id for uploader_id in settings.VECTOR_PARTITIONED_UPLOADERS}
+
+  result = await conn.execute(
+    text("SELECT relname FROM pg_class WHERE relkind = 'i' AND starts_with(relname, :prefix)"),
+    {"prefix": UPLOADER_HNSW_INDEX_PREFIX},
+  )
+  for (index_name,) in result.all():
+    if index_name not in expected:
+      await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+
+  for index_name, uploader_id in expected.items():
+    quoted = uploader_id.replace("'", "''")
+    created = await ensure_index(conn, index_name, "hnsw", {
+      "m": settings.VECTOR_HNSW_M,
+      "ef_construction": settings.VECTOR_HNSW_EF_CONSTRUCTION,
+    }, where=f"uploader_id = '{quoted}'")
+    if created:
+      logger.info(f"✅ Uploader HNSW index ready: {index_name} ({uploader_id})")
+
+async def run_migrations(conn: AsyncConnection):
+  """
+  create_all 이후 잠금 트랜잭션 안에서 실행되는 스키마 보정 작업
+  - 카탈로그만 바뀌는 가벼운 DDL 만 (테이블 재작성 / 인덱스 빌드는 run_index_migrations)
+  """
+  await add_content_hash_column(conn)
+  await add_content_tsv_column(conn)
+
+async def run_index_migrations():
+  """
+  인덱스 빌드 / 백필 (기동 후 백그라운드 작업)
+  - autocommit 연결에서 CONCURRENTLY 로 실행 → vectorized_docs 쓰기 / 다른 Replica 기동 / liveness probe 를 막지 않음
+  - pg_try_advisory_lock : 다른 인스턴스가 진행 중이면 건너뜀
+  - 중간에 중단돼도 INVALID 인덱스는 다음 실행에서 정리 후 재생성
+  """
+  try:
+    async with engine.connect() as conn:
+      conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+      locked = (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": INDEX_MIGRATION_LOCK_KEY})).scalar()
+      if not locked:
+        logger.info("⏭️ Index migrations already running on another instance, skipping")
+        return
+
+      try:
+        await backfill_content_tsv(conn)
+        await add_search_indexes(conn)
+        await ensure_vector_index(conn)
+        await ensure_uploader_vector_indexes(conn)
+        await ensure_semantic_cache_index(conn)
+      finally:
+        try:
+          await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": INDEX_MIGRATION_LOCK_KEY})
+        except BaseException:
+          # 세션 잠금이 풀에 남지 않도록 연결을 버림
+          await conn.invalidate()
+          raise
+
+    logger.info("✅ Index migrations finished")
+  except asyncio.CancelledError:
+    logger.info("🛑 Index migrations cancelled.")
+  except Exception as e:
+    logger.error(f"❌ Index migrations failed: {e}")
@@ -58,5 +58,32 @@ class MinioClientWrapper:
       if response:
         response.close()
 
+  async def iter_file_content(
+    self,
+    object_name: str,
+    bucket_name: str = None,
+    chunk_size: int = settings.MINIO_STREAM_CHUNK_BYTES,
+  ):
+    """
+    MinIO 원본을 chunk_size 단위로 나눠 읽는 비동기 iterator (파일 전체를 메모리에 올리지 않음)
+    - 소비자가 중간에 멈추면 aclosing 으로 닫아서 커넥션 반납
+    """
+    target_bucket = bucket_name if bucket_name else self.bucket_name
+    response = await asyncio.to_thread(
+      self.client.get_object,
+      target_bucket,
+      object_name
+    )
+    try:
+      while True:
+        # 데이터 읽는 과정 IO 블로킹 막기, 스레드 처리
+        data = await asyncio.to_thread(response.read, chunk_size)
+        if not data:
+          break
+        yield data
+    finally:
+      response.close()
+      response.release_conn()
+
 minio_client = MinioClientWrapper()
     
\ No newline at end of file
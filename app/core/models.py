@@ -70,5 +70,8 @@ class Message(Base):
     Index("idx_messages_user_uuid", "user_uuid"),
   )
 
+  # INSERT / UPDATE 시 서버 기본값(created_at, updated_at)을 RETURNING 으로 같이 받음 → commit 후 refresh SELECT 불필요
+  __mapper_args__ = {"eager_defaults": True}
+
   def __repr__(self):
     return f"<Message id={self.id} role={self.role} status={self.status}>"
\ No newline at end of file
@@ -0,0 +1,85 @@
+import logging
+from core.config import settings
+from core.ai import build_messages
+from core.rag_service import format_rag_context
+from core.tokenizer import count_tokens
+from core.vectorized_doc import VectorizedDoc
+
+logger = logging.getLogger("uvicorn")
+
+# 메시지 하나당 role / 구분자 등에 붙는 토큰 (OpenAI chat 포맷 기준 근사치)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def build_rag_system_message(docs: list[VectorizedDoc]) -> str:
+  """
+  검색된 문서를 시스템 프롬프트용 [Retrieved Knowledge] 블록으로 변환
+  """
+  if not docs:
+    return ""
+
+  rag_context_str = format_rag_context(docs)
+  return f"""
+You are an intelligent assistant named Protostar.
+
+[Instructions]
+- Use the provided [Retrieved Knowledge] to answer the user's question accurately.
+- If the answer is found in the knowledge, cite the source keywords if possible.
+- If the answer is NOT in the knowledge, rely on your general knowledge but mention that "This information is not in the provided documents."
+- Respond in the same language as the user's question (Korean).
+
+[Retrieved Knowledge]
+{rag_context_str}
+"""
+
+def build_system_context(docs: list[VectorizedDoc], base_context: str) -> str:
+  return f"{build_rag_system_message(docs)}\n\n{base_context}".strip()
+
+def count_messages_tokens(messages: list[dict]) -> int:
+  return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+def assemble_prompt(
+  prompt: str,
+  base_context: str,
+  docs: list[VectorizedDoc],
+  history: list[dict],
+  token_budget: int = settings.CHAT_CONTEXT_TOKEN_BUDGET,
+) -> tuple[str, list[dict], int]:
+  """
+  토큰 예산 안으로 프롬프트 구성
+  - 예산 초과 시 1) 오래된 대화 기록부터 2) 순위가 낮은 RAG 문서부터 제거
+  - 반환 : (시스템 컨텍스트, 남은 대화 기록, 입력 토큰 수)
+  """
+  docs = list(docs) if docs else []
+  history = list(history) if history else []
+
+  # 문서/기록을 하나씩 뺄 때마다 전체를 다시 세지 않도록 조각별 토큰을 미리 계산
+  base_tokens = count_messages_tokens(build_messages(prompt, build_system_context([], base_context), []))
+  doc_tokens = [count_tokens(format_rag_context([doc])) for doc in docs]
+  history_tokens = [count_tokens(item["content"]) + MESSAGE_OVERHEAD_TOKENS for item in history]
+  rag_header_tokens = count_tokens(build_rag_system_message(docs[:1])) - doc_tokens[0] if docs else 0
+
+  def estimate() -> int:
+    rag_tokens = rag_header_tokens + sum(doc_tokens) if docs else 0
+    return base_tokens + rag_tokens + sum(history_tokens)
+
+  dropped_history, dropped_docs = 0, 0
+  while estimate() > token_budget:
+    if history:
+      history.pop(0)
+      history_tokens.pop(0)
+      dropped_history += 1
+    elif docs:
+      docs.pop()
+      doc_tokens.pop()
+      dropped_docs += 1
+    else:
+      break
+
+  if dropped_history or dropped_docs:
+    logger.info(
+      f"✂️ Prompt trimmed to budget {token_budget}: -{dropped_history} history / -{dropped_docs} docs"
+    )
+
+  system_context = build_system_context(docs, base_context)
+  input_tokens = count_messages_tokens(build_messages(prompt, system_context, history))
+  return system_context, history, input_tokens
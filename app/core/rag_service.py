@@ -1,43 +1,242 @@
+import asyncio
 import logging
-from sqlalchemy import select
+import re
+from typing import NamedTuple
+from sqlalchemy import func, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import settings
 from core.database import AsyncSessionLocal
+from core.rerank import rerank
+from core.tokenizer import count_tokens
 from core.vectorized_doc import VectorizedDoc 
 from core.worker_knowledge import get_embeddings # 임베딩 함수 재사용, 나중에 AI 쪽 리펙토링 필요
 
 logger = logging.getLogger("uvicorn")
 
-async def search_similar_docs(query: str, top_k: int = 3):
+async def apply_vector_search_params(db: AsyncSession):
   """
-  질문과 가장 유사한 문서를 DB 에서 검색 (Cosine Similarity)
+  ANN 검색 파라미터를 현재 트랜잭션에만 적용 (set_config(..., true) = SET LOCAL)
+  - hnsw.ef_search : HNSW 탐색 후보 수 (클수록 정확, 느림)
+  - ivfflat.probes : IVFFlat 탐색 리스트 수
+  - hnsw.iterative_scan : 필터로 후보가 부족하면 더 탐색 (pgvector 0.8+, 설정했을 때만)
   """
+  await db.execute(
+    text("SELECT set_config('hnsw.ef_search', :ef_search, true), set_config('ivfflat.probes', :probes, true)"),
+    {
+      "ef_search": str(settings.VECTOR_HNSW_EF_SEARCH),
+      "probes": str(settings.VECTOR_IVFFLAT_PROBES),
+    },
+  )
+  if settings.VECTOR_HNSW_ITERATIVE_SCAN:
+    await db.execute(
+      text("SELECT set_config('hnsw.iterative_scan', :mode, true)"),
+      {"mode": settings.VECTOR_HNSW_ITERATIVE_SCAN},
+    )
+
+class SearchFilters(NamedTuple):
+  """
+  RAG 검색 범위 (None 이면 해당 조건 없음)
+  """
+  uploader_id: str | None = None
+  doc_ids: list[str] | None = None
+  category: str | None = None
+
+  @classmethod
+  def from_payload(cls, payload: dict | None) -> "SearchFilters | None":
+    """
+    채팅 작업 데이터의 searchFilters ({"uploaderId", "docIds", "category"}) → SearchFilters
+    """
+    if not payload:
+      return None
+    filters = cls(
+      uploader_id=payload.get("uploaderId") or None,
+      doc_ids=list(payload.get("docIds") or []) or None,
+      category=payload.get("category") or None,
+    )
+    return filters if any(filters) else None
+
+def apply_search_filters(stmt, filters: SearchFilters | None):
+  """
+  검색 범위를 SQL 조건으로 (uploader_id B-tree / knowledge_doc_id B-tree / meta_data GIN)
+  """
+  if filters is None:
+    return stmt
+  if filters.uploader_id:
+    # 업로더별 부분 HNSW 인덱스는 조건이 리터럴이어야 플래너가 사용할 수 있음 (prepared statement 파라미터 X)
+    stmt = stmt.where(VectorizedDoc.uploader_id == literal(filters.uploader_id, literal_execute=True))
+  if filters.doc_ids:
+    stmt = stmt.where(VectorizedDoc.knowledge_doc_id.in_(filters.doc_ids))
+  if filters.category:
+    stmt = stmt.where(VectorizedDoc.meta_data.contains({"category": filters.category}))
+  return stmt
+
+# 전문 검색에 쓸 질문 토큰 (유니코드 단어 문자만 → tsquery 특수문자 이스케이프 불필요)
+LEXICAL_TOKEN_PATTERN = re.compile(r"\w+")
+LEXICAL_MAX_TOKENS = 16
+
+# 질문 토큰 끝의 조사 (긴 것부터 검사)
+KOREAN_PARTICLES = (
+  "에서", "에게", "으로", "까지", "부터", "처럼", "이란", "이랑",
+  "은", "는", "이", "가", "을", "를", "의", "에", "도", "만", "로", "와", "과", "란",
+)
+
+def strip_particle(token: str) -> str:
+  for particle in KOREAN_PARTICLES:
+    if token.endswith(particle) and len(token) - len(particle) >= 2:
+      return token[:-len(particle)]
+  return token
+
+def build_lexical_query(query: str) -> str | None:
+  """
+  질문 → to_tsquery 문자열 (토큰마다 접두사 매칭, OR 결합)
+  - 'simple' 설정은 조사 분리를 하지 않으므로 질문 쪽 조사를 떼고 접두사로 매칭
+    ("프로토스타가" → "프로토스타:*" → 문서의 "프로토스타는" 도 매칭)
+  """
+  tokens = [strip_particle(token.lower()) for token in LEXICAL_TOKEN_PATTERN.findall(query) if len(token) > 1]
+  tokens = list(dict.fromkeys(tokens))[:LEXICAL_MAX_TOKENS]
+  if not tokens:
+    return None
+  return " | ".join(f"{token}:*" for token in tokens)
+
+async def embed_query(query: str) -> list[float] | None:
+  query_vectors = await get_embeddings([query])
+
+  if not query_vectors:
+    logger.warning("⚠️ Failed to generate embedding for query.")
+    return None
+
+  return query_vectors[0]
+
+async def vector_search(query_embedding: list[float] | None, limit: int, filters: SearchFilters = None) -> list[VectorizedDoc]:
+  """
+  코사인 거리 순 검색
+  """
+  if query_embedding is None:
+    return []
+
+  async with AsyncSessionLocal() as db:
+    await apply_vector_search_params(db)
+
+    stmt = (
+      apply_search_filters(select(VectorizedDoc), filters)
+      .order_by(VectorizedDoc.embedding.cosine_distance(query_embedding))
+      .limit(limit)
+    )
+
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
+
+async def lexical_search(query: str, limit: int, filters: SearchFilters = None) -> list[VectorizedDoc]:
+  """
+  content_tsv 전문 검색 (ts_rank_cd 순)
+  """
+  tsquery_text = build_lexical_query(query)
+  if not tsquery_text:
+    return []
+
+  tsquery = func.to_tsquery("simple", tsquery_text)
+  async with AsyncSessionLocal() as db:
+    stmt = (
+      apply_search_filters(select(VectorizedDoc), filters)
+      .where(VectorizedDoc.content_tsv.op("@@")(tsquery))
+      .order_by(func.ts_rank_cd(VectorizedDoc.content_tsv, tsquery).desc())
+      .limit(limit)
+    )
+
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
+
+def reciprocal_rank_fusion(
+  result_lists: list[list[VectorizedDoc]],
+  top_k: int,
+  k: int = settings.RAG_RRF_K,
+) -> list[VectorizedDoc]:
+  """
+  RRF : 각 결과 목록에서의 순위로 점수 합산 (score = Σ 1 / (k + rank))
+  - 점수 스케일이 다른 검색(코사인 거리 / ts_rank)을 정규화 없이 합칠 수 있음
+  """
+  scores: dict[str, float] = {}
+  docs: dict[str, VectorizedDoc] = {}
+
+  for results in result_lists:
+    for rank, doc in enumerate(results, start=1):
+      scores[doc.id] = scores.get(doc.id, 0.0) + 1 / (k + rank)
+      docs.setdefault(doc.id, doc)
+
+  ranked_ids = sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+  return [docs[doc_id] for doc_id in ranked_ids[:top_k]]
+
+async def search_similar_docs(query: str, top_k: int = 3, filters: SearchFilters = None):
+  """
+  질문과 가장 유사한 문서를 DB 에서 검색
+  - vector : Cosine Similarity
+  - hybrid : 전문 검색 + 벡터 검색 동시 실행 → RRF 병합 (전문 검색 실패 시 벡터 결과만 사용)
+  - filters : 업로더 / 문서 / 카테고리 범위 (SQL 조건으로 적용)
+  - RAG_RERANK_ENABLED : 후보 RAG_RERANK_CANDIDATES 개 → 중복 청크 정리 + MMR → top_k → RAG 토큰 상한
+  """
+  fetch_k = max(top_k, settings.RAG_RERANK_CANDIDATES) if settings.RAG_RERANK_ENABLED else top_k
 
   try:
-    # 1 질문을 벡터로 변환 
-    query_vectors = await get_embeddings([query])
-    
-    if not query_vectors:
-      logger.warning("⚠️ Failed to generate embedding for query.")
-      return []
-    
-    query_embedding = query_vectors[0]
+    if settings.RAG_SEARCH_MODE != "hybrid":
+      query_embedding = await embed_query(query)
+      docs = await vector_search(query_embedding, fetch_k, filters)
+      logger.info(f"🔍 RAG Search found {len(docs)} docs for: '{query}'")
+    else:
+      async def embed_and_search():
+        embedding = await embed_query(query)
+        return embedding, await vector_search(embedding, max(fetch_k, settings.RAG_HYBRID_CANDIDATES), filters)
 
-    async with AsyncSessionLocal() as db:
-      stmt = (
-        select(VectorizedDoc)
-        .order_by(VectorizedDoc.embedding.cosine_distance(query_embedding))
-        .limit(top_k)
+      vector_result, lexical_docs = await asyncio.gather(
+        embed_and_search(),
+        lexical_search(query, max(fetch_k, settings.RAG_HYBRID_CANDIDATES), filters),
+        return_exceptions=True,
       )
 
-      result = await db.execute(stmt)
-      docs = result.scalars().all()
-      
-      logger.info(f"🔍 RAG Search found {len(docs)} docs for: '{query}'")
+      if isinstance(vector_result, BaseException):
+        raise vector_result
+      if isinstance(lexical_docs, BaseException):
+        logger.warning(f"⚠️ Lexical search failed, using vector results only: {lexical_docs}")
+        lexical_docs = []
+
+      query_embedding, vector_docs = vector_result
+      docs = reciprocal_rank_fusion([vector_docs, lexical_docs], fetch_k)
+      logger.info(
+        f"🔍 RAG Hybrid Search found {len(docs)} docs "
+        f"(vector {len(vector_docs)} / lexical {len(lexical_docs)}) for: '{query}'"
+      )
+
+    if not settings.RAG_RERANK_ENABLED:
       return docs
 
+    candidates = len(docs)
+    if query_embedding is not None:
+      docs = rerank(query_embedding, docs, top_k)
+    else:
+      docs = docs[:top_k]
+    docs = trim_to_token_budget(docs)
+    logger.info(f"🧮 RAG Rerank kept {len(docs)} of {candidates} candidates")
+    return docs
+
   except Exception as e:
     logger.error(f"❌ Search Similar Docs Error: {e}")
     raise e
 
+def trim_to_token_budget(docs: list[VectorizedDoc], budget: int = settings.RAG_CONTEXT_TOKEN_BUDGET) -> list[VectorizedDoc]:
+  """
+  순위대로 담다가 RAG 토큰 상한을 넘으면 중단 (1위 문서는 항상 포함)
+  """
+  if budget <= 0:
+    return docs
+
+  kept, used = [], 0
+  for doc in docs:
+    tokens = count_tokens(format_rag_context([doc]))
+    if kept and used + tokens > budget:
+      break
+    kept.append(doc)
+    used += tokens
+  return kept
+
 def format_rag_context(docs: list[VectorizedDoc]) -> str:
   """
   검색된 문서들을 LLM 프롬프트에 넣기 좋게 텍스트로 변환
@@ -11,9 +11,19 @@ pool = redis.ConnectionPool.from_url(
     max_connections=1000,
 )
 
+# 바이너리 값(임베딩 등) 저장용, 디코딩 없이 bytes 그대로 주고받음
+binary_pool = redis.ConnectionPool.from_url(
+    settings.REDIS_URL,
+    decode_responses=False,
+    max_connections=100,
+)
+
 def get_redis_client() -> redis.Redis:
     return redis.Redis(connection_pool=pool)
 
+def get_binary_redis_client() -> redis.Redis:
+    return redis.Redis(connection_pool=binary_pool)
+
 async def init_test_redis():
     redis_client = get_redis_client()
     try:
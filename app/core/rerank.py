@@ -0,0 +1,126 @@
+import numpy as np
+from core.config import settings
+from core.vectorized_doc import VectorizedDoc
+
+def find_overlap(head: str, tail: str, max_overlap: int, min_overlap: int) -> int:
+  """
+  head 의 끝과 tail 의 시작이 겹치는 길이 (RecursiveCharacterTextSplitter 의 chunk_overlap 구간), 없으면 0
+  """
+  start = max(0, len(head) - max_overlap)
+  probe = tail[:min_overlap]
+  if len(probe) < min_overlap:
+    return 0
+
+  pos = head.find(probe, start)
+  while pos != -1:
+    overlap = len(head) - pos
+    if tail.startswith(head[pos:]):
+      return overlap
+    pos = head.find(probe, pos + 1)
+  return 0
+
+def _stitch(first: VectorizedDoc, second: VectorizedDoc, overlap: int) -> VectorizedDoc:
+  """
+  이웃한 두 청크를 겹치는 구간 한 번만 남기고 합침 (세션에 붙지 않는 임시 객체)
+  """
+  embedding = None
+  if first.embedding is not None and second.embedding is not None:
+    embedding = (np.asarray(first.embedding, dtype=np.float32) + np.asarray(second.embedding, dtype=np.float32)) / 2
+
+  return VectorizedDoc(
+    id=first.id,
+    chunk_index=first.chunk_index,
+    content=first.content + second.content[overlap:],
+    meta_data=first.meta_data,
+    embedding=embedding,
+    knowledge_doc_id=first.knowledge_doc_id,
+    uploader_id=first.uploader_id,
+  )
+
+def dedupe_chunks(
+  docs: list[VectorizedDoc],
+  max_overlap: int = settings.CHUNK_OVERLAP,
+  min_overlap: int = settings.RAG_DEDUP_MIN_OVERLAP_CHARS,
+) -> list[VectorizedDoc]:
+  """
+  중복 청크 정리 (순위 유지)
+  - 같은 내용(content_hash / 본문 포함 관계) → 순위가 높은 쪽만 남김
+  - 같은 문서의 이웃 청크(chunk_index ±1)가 overlap 구간을 공유 → 하나로 이어 붙임
+  """
+  kept: list[VectorizedDoc] = []
+
+  for doc in docs:
+    merged = False
+    for i, other in enumerate(kept):
+      if (doc.content_hash and doc.content_hash == other.content_hash) or doc.content in other.content:
+        merged = True
+        break
+      if doc.knowledge_doc_id != other.knowledge_doc_id:
+        continue
+
+      if doc.chunk_index == other.chunk_index + 1:
+        overlap = find_overlap(other.content, doc.content, max_overlap, min_overlap)
+        if overlap:
+          kept[i] = _stitch(other, doc, overlap)
+          merged = True
+          break
+      elif doc.chunk_index == other.chunk_index - 1:
+        overlap = find_overlap(doc.content, other.content, max_overlap, min_overlap)
+        if overlap:
+          kept[i] = _stitch(doc, other, overlap)
+          merged = True
+          break
+
+    if not merged:
+      kept.append(doc)
+
+  return kept
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+  norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+  return matrix / np.where(norms == 0, 1, norms)
+
+def mmr_select(
+  query_embedding,
+  embeddings: list,
+  k: int,
+  lambda_mult: float = settings.RAG_MMR_LAMBDA,
+) -> list[int]:
+  """
+  MMR (Maximal Marginal Relevance) : 질문과의 관련도 - 이미 고른 청크와의 유사도
+  - score = λ * sim(q, d) - (1 - λ) * max sim(d, 선택됨)
+  - 반환 : 고른 순서대로의 인덱스
+  """
+  if not embeddings or k <= 0:
+    return []
+
+  doc_matrix = _normalize(np.asarray(embeddings, dtype=np.float32))
+  query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+
+  relevance = doc_matrix @ query
+  similarity = doc_matrix @ doc_matrix.T
+
+  first = int(np.argmax(relevance))
+  selected = [first]
+  max_similarity = similarity[first].copy()
+
+  while len(selected) < min(k, len(embeddings)):
+    scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+    scores[selected] = -np.inf
+    chosen = int(np.argmax(scores))
+    selected.append(chosen)
+    np.maximum(max_similarity, similarity[chosen], out=max_similarity)
+
+  return selected
+
+def rerank(query_embedding, docs: list[VectorizedDoc], top_k: int) -> list[VectorizedDoc]:
+  """
+  넉넉히 가져온 후보 → 중복 정리 → MMR 로 top_k 선택
+  - 임베딩이 없는 후보는 MMR 뒤에 원래 순서로 붙임
+  """
+  docs = dedupe_chunks(docs)
+  with_embedding = [doc for doc in docs if doc.embedding is not None]
+  without_embedding = [doc for doc in docs if doc.embedding is None]
+
+  order = mmr_select(query_embedding, [doc.embedding for doc in with_embedding], top_k)
+  return ([with_embedding[i] for i in order] + without_embedding)[:top_k]
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from sqlalchemy import delete, or_, select, update
+from core.config import settings
+from core.database import AsyncSessionLocal
+from core.semantic_cache_entry import SemanticCacheEntry
+from core.knowledge_version import get_knowledge_version
+from core.rag_service import apply_vector_search_params
+from core.stream_publisher import stream_publisher
+from core.worker_knowledge import get_embeddings
+
+logger = logging.getLogger("uvicorn")
+
+class SemanticCacheLookup(NamedTuple):
+  """
+  캐시 조회 결과
+  - answer 가 None 이면 미스 (embedding / kb_version 은 저장할 때 재사용)
+  """
+  answer: str | None
+  similarity: float
+  kb_version: int
+  embedding: list[float] | None
+
+def is_eligible(mode: str, base_context: str, search_filters=None) -> bool:
+  """
+  페이지 컨텍스트 등 요청별 context 가 붙은 질문, 검색 범위가 지정된 질문은 답변이 달라지므로 캐시하지 않음
+  """
+  return (
+    settings.SEMANTIC_CACHE_ENABLED
+    and mode in settings.SEMANTIC_CACHE_MODES
+    and not base_context
+    and not search_filters
+  )
+
+async def lookup(query: str, mode: str) -> SemanticCacheLookup:
+  """
+  같은 범위(mode + 지식 베이스 버전 + 임베딩 모델)에서 가장 가까운 질문의 답변 조회
+  - 대화 기록이 없는 턴에서만 호출 (기록이 있는 턴의 답변은 저장도 하지 않음)
+  - 캐시 장애(Redis / 임베딩 / DB)는 미스로 처리 (embedding 이 None 이면 저장도 생략)
+  """
+  try:
+    kb_version = await get_knowledge_version()
+  except Exception as e:
+    logger.warning(f"⚠️ Semantic cache version read failed: {e}")
+    return SemanticCacheLookup(None, 0.0, 0, None)
+
+  try:
+    query_vectors = await get_embeddings([query])
+  except Exception as e:
+    logger.warning(f"⚠️ Semantic cache embedding failed: {e}")
+    return SemanticCacheLookup(None, 0.0, kb_version, None)
+
+  query_embedding = query_vectors[0]
+  distance = SemanticCacheEntry.embedding.cosine_distance(query_embedding)
+  expires_after = datetime.utcnow() - timedelta(seconds=settings.SEMANTIC_CACHE_TTL_SEC)
+
+  try:
+    async with AsyncSessionLocal() as db:
+      await apply_vector_search_params(db)
+
+      result = await db.execute(
+        select(SemanticCacheEntry.id, SemanticCacheEntry.answer, distance.label("distance"))
+        .where(SemanticCacheEntry.mode == mode)
+        .where(SemanticCacheEntry.kb_version == kb_version)
+        .where(SemanticCacheEntry.embedding_model == settings.OPENROUTER_EMBEDDING_MODEL)
+        .where(SemanticCacheEntry.created_at > expires_after)
+        .order_by(distance)
+        .limit(1)
+      )
+      row = result.first()
+
+      if row is None or 1 - row.distance < settings.SEMANTIC_CACHE_THRESHOLD:
+        similarity = 0.0 if row is None else 1 - row.distance
+        return SemanticCacheLookup(None, similarity, kb_version, query_embedding)
+
+      await db.execute(
+        update(SemanticCacheEntry)
+        .where(SemanticCacheEntry.id == row.id)
+        .values(hit_count=SemanticCacheEntry.hit_count + 1)
+      )
+      await db.commit()
+  except Exception as e:
+    # 캐시 장애는 일반 경로(RAG + LLM)로 진행
+    logger.warning(f"⚠️ Semantic cache lookup failed: {e}")
+    return SemanticCacheLookup(None, 0.0, kb_version, query_embedding)
+
+  logger.info(f"🎯 Semantic cache hit ({1 - row.distance:.3f}) for: '{query}'")
+  return SemanticCacheLookup(row.answer, 1 - row.distance, kb_version, query_embedding)
+
+async def purge() -> int:
+  """
+  다시 쓰일 수 없는 항목 삭제 (TTL 이 지났거나 지식 베이스 버전이 지난 항목)
+  - TTL 은 조회 시에만 확인하므로 지우지 않으면 테이블이 계속 커지고 HNSW 후처리 필터 검색이 느려짐
+  """
+  kb_version = await get_knowledge_version()
+  expires_after = datetime.utcnow() - timedelta(seconds=settings.SEMANTIC_CACHE_TTL_SEC)
+
+  async with AsyncSessionLocal() as db:
+    result = await db.execute(
+      delete(SemanticCacheEntry).where(or_(
+        SemanticCacheEntry.created_at <= expires_after,
+        SemanticCacheEntry.kb_version < kb_version,
+      ))
+    )
+    await db.commit()
+  return result.rowcount
+
+async def run_purge_loop():
+  """
+  SEMANTIC_CACHE_PURGE_INTERVAL_SEC 마다 purge (캐시가 꺼져 있으면 바로 종료)
+  """
+  if not settings.SEMANTIC_CACHE_ENABLED:
+    return
+
+  try:
+    while True:
+      try:
+        deleted = await purge()
+        if deleted:
+          logger.info(f"🧹 Semantic cache purged {deleted} entries")
+      except Exception as e:
+        logger.warning(f"⚠️ Semantic cache purge failed: {e}")
+
+      await asyncio.sleep(settings.SEMANTIC_CACHE_PURGE_INTERVAL_SEC)
+  except asyncio.CancelledError:
+    logger.info("🛑 Semantic cache purge loop cancelled.")
+
+async def store(cached: SemanticCacheLookup, query: str, mode: str, answer: str):
+  """
+  LLM 답변 저장 (조회 시점의 지식 베이스 버전으로 저장하여 그 사이 문서가 바뀐 답변은 재사용되지 않음)
+  """
+  if cached.embedding is None or not answer:
+    return
+
+  try:
+    async with AsyncSessionLocal() as db:
+      db.add(SemanticCacheEntry(
+        mode=mode,
+        kb_version=cached.kb_version,
+        query=query,
+        answer=answer,
+        embedding=cached.embedding,
+        embedding_model=settings.OPENROUTER_EMBEDDING_MODEL,
+      ))
+      await db.commit()
+  except Exception as e:
+    logger.warning(f"⚠️ Semantic cache store failed: {e}")
+
+async def replay(answer: str, channel: str, base_payload: dict):
+  """
+  캐시된 답변을 토큰 스트림처럼 잘라서 기존 chat:stream 발송 경로로 재생
+  """
+  size = settings.SEMANTIC_CACHE_REPLAY_CHUNK_CHARS
+  delay = settings.SEMANTIC_CACHE_REPLAY_DELAY_MS / 1000
+
+  for start in range(0, len(answer), size):
+    await stream_publisher.publish_token(channel, answer[start:start + size], base_payload)
+    if delay > 0:
+      await asyncio.sleep(delay)
@@ -0,0 +1,28 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index
+from pgvector.sqlalchemy import Vector
+from core.database import Base
+
+class SemanticCacheEntry(Base):
+  __tablename__ = "semantic_cache"
+
+  id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+
+  # 캐시 범위 : 같은 mode + 같은 지식 베이스 버전에서만 재사용
+  mode = Column(String(40), nullable=False)
+  kb_version = Column(Integer, nullable=False, default=0)
+
+  query = Column(Text, nullable=False)
+  answer = Column(Text, nullable=False)
+
+  embedding = Column(Vector(1536))
+  embedding_model = Column(String, nullable=False)
+
+  hit_count = Column(Integer, default=0)
+  created_at = Column(DateTime, default=datetime.utcnow)
+
+  # embedding ANN 인덱스는 migrations.ensure_semantic_cache_index 에서 관리 (캐시 설정 / HNSW 지원 여부에 따라)
+  __table_args__ = (
+    Index("idx_semantic_cache_scope", "mode", "kb_version"),
+  )
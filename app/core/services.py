@@ -1,18 +1,27 @@
+import asyncio
 import uuid
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import select, insert, update, desc, true
+from sqlalchemy.orm import aliased
 from .models import Message, MessageRole, ProcessingStatus
+from core.config import settings
+from core.tokenizer import count_tokens
+from core import history_cache
 
-async def save_user_message(
+async def save_user_message_with_history(
   db: AsyncSession,
   user_uuid: uuid.UUID,
   session_id: str,
   content: str,
-) -> Message:
+) -> tuple[Message, list[Message]]:
   """
-  User Message 저장
+  턴 시작 : User Message 저장 + 프롬프트용 대화 윈도우 조회를 한 번에
+  - 세션 캐시 hit : INSERT ... RETURNING 한 문장
+  - 세션 캐시 miss : INSERT(CTE) + 최근 기록 SELECT 를 한 문장으로 실행 후 캐시 채움
+  - 조회 결과에는 방금 저장한 질문이 들어가지 않음 (CTE 의 SELECT 는 INSERT 이전 스냅샷)
   """
   new_message = Message(
+    id=uuid.uuid4(),
     user_uuid=user_uuid,
     session_id=session_id,
     role=MessageRole.USER,
@@ -22,11 +31,55 @@ async def save_user_message(
     status=ProcessingStatus.COMPLETED,
   )
 
-  db.add(new_message)
+  cached_messages = await history_cache.load_messages(session_id)
+  if cached_messages is not None:
+    db.add(new_message)
+    await db.commit()
+    await history_cache.append_message(new_message)
+    return new_message, select_history_window(cached_messages)
+
+  inserted = (
+    insert(Message.__table__)
+    .values(
+      id=new_message.id,
+      user_uuid=user_uuid,
+      session_id=session_id,
+      role=new_message.role,
+      content_full=content,
+      content_summary=None,
+      token_usage={},
+      status=new_message.status,
+    )
+    .returning(Message.__table__.c.created_at)
+    .cte("inserted_message")
+  )
+  recent = (
+    select(Message)
+    .where(Message.session_id == session_id)
+    .where(Message.status != ProcessingStatus.FAILED)
+    .order_by(desc(Message.created_at))
+    .limit(settings.CHAT_HISTORY_CACHE_SIZE)
+    .subquery("recent_messages")
+  )
+  recent_message = aliased(Message, recent)
+
+  # 기록이 없어도 INSERT 결과 한 줄은 받도록 LEFT JOIN
+  result = await db.execute(
+    select(inserted.c.created_at, recent_message)
+    .select_from(inserted)
+    .outerjoin(recent_message, true())
+  )
+  rows = result.all()
   await db.commit()
-  await db.refresh(new_message)
 
-  return new_message
+  new_message.created_at = rows[0][0]
+  messages = sorted(
+    (message for _, message in rows if message is not None),
+    key=lambda message: message.created_at,
+  )
+  await history_cache.fill_messages(session_id, messages + [new_message])
+
+  return new_message, select_history_window(messages)
 
 async def save_initial_response(
   db: AsyncSession, 
@@ -57,10 +110,27 @@ async def save_initial_response(
 
   db.add(new_message)
   await db.commit()
-  await db.refresh(new_message)
+  await history_cache.append_message(new_message)
 
   return new_message
 
+def merge_summary_usage(token_usage: dict | None, summary_token_usage: dict) -> dict:
+  """
+  기존 token_usage 에 요약 사용량을 붙이고 total(main + summary) 재계산
+  """
+  current_usage = dict(token_usage) if token_usage else {}
+  current_usage["summary"] = summary_token_usage
+
+  main_usage = current_usage.get("main", {"input": 0, "output": 0})
+  total_input = main_usage.get("input", 0) + summary_token_usage.get("input", 0)
+  total_output = main_usage.get("output", 0) + summary_token_usage.get("output", 0)
+
+  current_usage["total"] = {
+    "input": total_input,
+    "output": total_output,
+  }
+  return current_usage
+
 async def update_message_with_summary(
   db: AsyncSession,
   message_id: uuid.UUID,
@@ -78,27 +148,61 @@ async def update_message_with_summary(
   if not message:
     raise ValueError(f"Message {message_id} not found")
 
-  current_usage = dict(message.token_usage) if message.token_usage else {}
-  current_usage["summary"] = summary_token_usage
-
-  main_usage = current_usage.get("main", {"input": 0, "output": 0})
-  total_input = main_usage.get("input", 0) + summary_token_usage.get("input", 0)
-  total_output = main_usage.get("output", 0) + summary_token_usage.get("output", 0)
-
-  current_usage["total"] = {
-    "input": total_input,
-    "output": total_output,
-  }
-
   message.content_summary = summary_text
-  message.token_usage = current_usage
+  message.token_usage = merge_summary_usage(message.token_usage, summary_token_usage)
   message.status = ProcessingStatus.COMPLETED
 
   await db.commit()
-  await db.refresh(message)
+  await history_cache.replace_message(message)
 
   return message
 
+async def update_messages_with_summaries(
+  db: AsyncSession,
+  messages: list[Message],
+  results: list[dict],
+):
+  """
+  Summary Worker 배치 모드 : 요약 결과를 PK 기준 bulk UPDATE 한 번으로 저장
+  - messages 는 get_messages_by_ids 로 읽은 객체 (저장 후 캐시 반영용으로 값도 갱신)
+  """
+  if not messages:
+    return
+
+  rows = [
+    {
+      "id": message.id,
+      "content_summary": result["summary"],
+      "token_usage": merge_summary_usage(message.token_usage, result["usage"]),
+      "status": ProcessingStatus.COMPLETED,
+    }
+    for message, result in zip(messages, results)
+  ]
+
+  await db.execute(update(Message), rows)
+  await db.commit()
+
+  for message, row in zip(messages, rows):
+    message.content_summary = row["content_summary"]
+    message.token_usage = row["token_usage"]
+    message.status = row["status"]
+
+  await asyncio.gather(*[history_cache.replace_message(message) for message in messages])
+
+async def get_messages_by_ids(
+  db: AsyncSession,
+  message_ids: list[uuid.UUID],
+) -> list[Message]:
+  """
+  여러 메시지를 한 번에 조회 (WHERE id IN (...)), 없는 id 는 빠짐
+  """
+  if not message_ids:
+    return []
+
+  query = select(Message).where(Message.id.in_(message_ids))
+  result = await db.execute(query)
+  return list(result.scalars().all())
+
 async def get_message_by_id(
   db: AsyncSession,
   message_id: uuid.UUID,
@@ -111,28 +215,29 @@ async def get_message_by_id(
   result = await db.execute(query)
   return result.scalar_one_or_none()
 
-async def get_session_history(
-  db: AsyncSession,
-  session_id: str,
-  exclude_ids: list[uuid.UUID] = None
-) -> list[Message]:
+def history_content(message: Message) -> str:
   """
-  Memory 세션의 '모든' 대화 기록을 조회한다. 
-  - 최신순으로 가져와서 역순으로 정렬
-  - 실패한 메시지는 제외 
+  프롬프트에 들어갈 내용 (요약이 있으면 요약, 없으면 원문)
   """
+  return message.content_summary if message.content_summary else message.content_full
 
-  query =  (
-    select(Message)
-    .where(Message.session_id == session_id)
-    .where(Message.status != ProcessingStatus.FAILED)
-    .order_by(desc(Message.created_at))
-  )
-
-  if exclude_ids:
-    query = query.where(Message.id.notin_(exclude_ids))
-
-  result = await db.execute(query)
-  messages = result.scalars().all()
-
-  return list(reversed(messages))
\ No newline at end of file
+def select_history_window(messages: list[Message]) -> list[Message]:
+  """
+  최근 CHAT_HISTORY_WINDOW_MESSAGES 개 중 CHAT_HISTORY_TOKEN_BUDGET 안에 들어가는 만큼 (오래된 순)
+  """
+  candidates = [
+    message for message in messages
+    if message.status != ProcessingStatus.FAILED
+  ][-settings.CHAT_HISTORY_WINDOW_MESSAGES:]
+
+  # 최신 메시지부터 토큰 예산 안에서 채움
+  window = []
+  used_tokens = 0
+  for message in reversed(candidates):
+    tokens = count_tokens(history_content(message))
+    if window and used_tokens + tokens > settings.CHAT_HISTORY_TOKEN_BUDGET:
+      break
+    window.append(message)
+    used_tokens += tokens
+
+  return list(reversed(window))
@@ -1,5 +1,8 @@
 import logging
 from core.redis import get_redis_client
+from core.config import settings
+from core.concurrency import limiters
+from core.loop_monitor import loop_monitor
 import psutil
 import asyncio
 import time
@@ -7,22 +10,75 @@ import json
 
 logger = logging.getLogger("uvicorn")
 
+HEARTBEAT_KEY = "cluster:heartbeats"
+CAPACITY_KEY = "cluster:capacity"
+HEARTBEAT_INTERVAL_SEC = 3
+
+def build_capacity_record(instance_id: str, cpu_usage: float, memory_usage: float, loop_lag: float, is_health: bool) -> dict:
+    """
+    NestJS 가 가장 여유 있는 인스턴스로 작업을 보내기 위한 용량 정보
+    - free_slots : 워커별 남은 동시 작업 수 (적응형 limit - in_flight)
+    - score : 0(받으면 안 됨) ~ 1(한가함), 채팅 슬롯 / CPU / MEM 여유 중 가장 작은 값에 루프 지연 패널티 적용
+    """
+    workers = {name: limiter.snapshot() for name, limiter in limiters.items()}
+    chat = workers.get("chat")
+
+    if not is_health:
+        score = 0.0
+    else:
+        slot_headroom = chat["available"] / chat["limit"] if chat and chat["limit"] else 1.0
+        lag_factor = max(0.0, 1 - loop_lag / settings.HEARTBEAT_LOOP_LAG_LIMIT_SEC)
+        score = min(slot_headroom, 1 - cpu_usage / 100, 1 - memory_usage / 100) * lag_factor
+
+    return {
+        "instance": instance_id,
+        "ts": time.time(),
+        "healthy": is_health,
+        "score": round(max(0.0, score), 3),
+        "cpu": cpu_usage,
+        "memory": memory_usage,
+        "loop_lag_ms": round(loop_lag * 1000, 1),
+        "in_flight_streams": chat["in_flight"] if chat else 0,
+        "free_slots": {name: snapshot["available"] for name, snapshot in workers.items()},
+        "limits": {name: snapshot["limit"] for name, snapshot in workers.items()},
+    }
+
+async def prune_stale_capacity(redis_client):
+    """
+    비정상 종료로 HDEL 하지 못한 인스턴스 항목 정리
+    """
+    records = await redis_client.hgetall(CAPACITY_KEY)
+    expired_before = time.time() - settings.HEARTBEAT_CAPACITY_STALE_SEC
+    stale = []
+    for field, raw in records.items():
+        try:
+            if json.loads(raw)["ts"] < expired_before:
+                stale.append(field)
+        except (ValueError, KeyError, TypeError):
+            stale.append(field)
+    if stale:
+        await redis_client.hdel(CAPACITY_KEY, *stale)
+
 async def report_health_status_to_redis(instance_id: str):
     """
     [시스템 상태 파악 및 생존 신고용]
-    - 주기 : 
+    - 주기 : 3초
     - 전략 : 침묵 전략(자원 부족 시 침묵 + 로깅)
+    - 용량 : cluster:capacity 해시에 인스턴스별 부하 정보 기록 (과부하여도 score 0 으로 기록)
     """
 
     redis_client = get_redis_client()
 
     psutil.cpu_percent(interval=None)
 
+    beat = 0
+
     while True:
         try:
             # 1. 상태 파악 
             cpu_usage = psutil.cpu_percent(interval=None)
             memory_usage = psutil.virtual_memory().percent
+            loop_lag = loop_monitor.pop_max_lag()
 
             is_health = True
             fail_reason = None
@@ -33,8 +89,11 @@ async def report_health_status_to_redis(instance_id: str):
                 fail_reason = f"overload (CPU: {cpu_usage}%, MEM: {memory_usage}%)"
 
             # 3. 행동 결정
+            capacity = build_capacity_record(instance_id, cpu_usage, memory_usage, loop_lag, is_health)
+            await redis_client.hset(CAPACITY_KEY, instance_id, json.dumps(capacity))
+
             if is_health:    
-                await redis_client.zadd("cluster:heartbeats", {instance_id: time.time()})
+                await redis_client.zadd(HEARTBEAT_KEY, {instance_id: time.time()})
             else:
                 log_payload = {
                     "level": "warn",
@@ -59,4 +118,11 @@ async def report_health_status_to_redis(instance_id: str):
             }
             logger.exception(json.dumps(error_payload))
 
-        await asyncio.sleep(3)
\ No newline at end of file
+        beat += 1
+        if beat % 10 == 0:
+            try:
+                await prune_stale_capacity(redis_client)
+            except Exception as e:
+                logger.warning(f"⚠️ Capacity prune failed: {e}")
+
+        await asyncio.sleep(HEARTBEAT_INTERVAL_SEC)
\ No newline at end of file
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+from core.config import settings
+from core.redis import get_redis_client
+
+logger = logging.getLogger("uvicorn")
+
+class _ChannelBuffer:
+  """
+  채널 하나에 쌓이는 토큰 버퍼
+  - base_payload : 토큰을 제외한 message payload (uuid, sessionId, timestamp)
+  """
+  __slots__ = ("base_payload", "parts", "size")
+
+  def __init__(self, base_payload: dict):
+    self.base_payload = base_payload
+    self.parts: list[str] = []
+    self.size = 0
+
+  def to_message(self) -> str:
+    return json.dumps({
+      "type": "message",
+      "content": "".join(self.parts),
+      **self.base_payload,
+    })
+
+class StreamPublisher:
+  """
+  채팅 토큰 Coalescing Publisher
+  - 토큰마다 PUBLISH 하지 않고 채널별 버퍼에 모았다가 시간 창(flush_interval_ms) 또는 크기(max_bytes) 기준으로 발송
+  - 여러 채널의 버퍼를 pipeline 한 번으로 발송 → 동시 작업이 많을수록 Redis 왕복 수가 줄어듦
+  - NestJS 로 나가는 message / done payload 형식은 그대로 유지 (content 만 여러 토큰이 합쳐진 문자열)
+  - transport="stream" 이면 PUBLISH 대신 작업별 Redis Stream 에 XADD ({"data": payload}) 하여 재접속한 소비자가 이어 읽을 수 있게 함
+  - 다른 채널의 flush(백그라운드 루프 포함)에서 발송에 실패한 채널은 기록해 두었다가
+    해당 채널의 다음 publish_token / publish_done 에서 예외로 전달 (토큰이 조용히 유실되지 않도록)
+  """
+
+  def __init__(
+    self,
+    redis_client=None,
+    flush_interval_ms: int = settings.STREAM_FLUSH_INTERVAL_MS,
+    max_bytes: int = settings.STREAM_FLUSH_MAX_BYTES,
+    transport: str = settings.CHAT_STREAM_TRANSPORT,
+  ):
+    self.redis_client = redis_client if redis_client else get_redis_client()
+    self.flush_interval = flush_interval_ms / 1000
+    self.max_bytes = max_bytes
+    self.transport = transport
+
+    self._buffers: dict[str, _ChannelBuffer] = {}
+    # flush 순서 보장용 (같은 채널의 조각이 서로 다른 커넥션으로 역전되어 나가지 않도록)
+    self._flush_lock = asyncio.Lock()
+    self._flush_task: asyncio.Task | None = None
+    # 채널 → 백그라운드 / 다른 채널 flush 에서 난 발송 에러
+    self._failures: dict[str, Exception] = {}
+
+  async def publish_token(self, channel: str, token: str, base_payload: dict):
+    """
+    토큰을 채널 버퍼에 추가. 크기 기준을 넘으면 즉시 발송, 아니면 flush 루프가 발송
+    """
+    self._raise_failure(channel)
+
+    if self.flush_interval <= 0:
+      pipe = self.redis_client.pipeline(transaction=False)
+      self._send(pipe, channel, json.dumps({"type": "message", "content": token, **base_payload}))
+      await pipe.execute()
+      return
+
+    buffer = self._buffers.get(channel)
+    if buffer is None:
+      buffer = self._buffers[channel] = _ChannelBuffer(base_payload)
+
+    buffer.parts.append(token)
+    buffer.size += len(token.encode("utf-8"))
+
+    if buffer.size >= self.max_bytes:
+      await self.flush(channel)
+    else:
+      self._ensure_flush_loop()
+
+  async def publish_done(self, channel: str, done_payload: dict):
+    """
+    남은 토큰을 먼저 발송하고 done 신호를 같은 pipeline 으로 발송 (순서 보장)
+    """
+    self._raise_failure(channel)
+    await self.flush(channel, tail_message=json.dumps(done_payload))
+
+  async def flush(self, channel: str = None, tail_message: str = None):
+    """
+    channel 이 없으면 모든 채널 버퍼를 발송
+    """
+    async with self._flush_lock:
+      if channel is None:
+        targets = list(self._buffers.items())
+        self._buffers.clear()
+      else:
+        buffer = self._buffers.pop(channel, None)
+        targets = [(channel, buffer)] if buffer else []
+
+      if not targets and tail_message is None:
+        return
+
+      pipe = self.redis_client.pipeline(transaction=False)
+      for target_channel, buffer in targets:
+        self._send(pipe, target_channel, buffer.to_message())
+      if tail_message is not None:
+        self._send(pipe, channel, tail_message)
+
+      try:
+        await pipe.execute()
+      except Exception as e:
+        # 호출한 채널은 예외로 바로 받으므로, 함께 실린 나머지 채널만 기록
+        for target_channel, _ in targets:
+          if target_channel != channel:
+            self._failures[target_channel] = e
+        raise
+
+  def _raise_failure(self, channel: str):
+    """
+    이전 flush 에서 이 채널의 토큰 발송이 실패했으면 남은 버퍼를 버리고 예외 전달 → 작업은 DLQ 경로로
+    """
+    error = self._failures.pop(channel, None)
+    if error is not None:
+      self._buffers.pop(channel, None)
+      raise error
+
+  def _send(self, pipe, channel: str, message: str):
+    if self.transport == "stream":
+      # 작업 하나당 스트림 하나, 길이 제한 + TTL 로 정리
+      pipe.xadd(channel, {"data": message}, maxlen=settings.CHAT_STREAM_MAXLEN, approximate=True)
+      pipe.expire(channel, settings.CHAT_STREAM_TTL_SEC)
+    else:
+      pipe.publish(channel, message)
+
+  def _ensure_flush_loop(self):
+    if self._flush_task is None or self._flush_task.done():
+      self._flush_task = asyncio.create_task(self._flush_loop())
+
+  async def _flush_loop(self):
+    """
+    버퍼가 빌 때까지 flush_interval 마다 모든 채널을 한 번에 발송
+    """
+    while self._buffers:
+      await asyncio.sleep(self.flush_interval)
+      try:
+        await self.flush()
+      except Exception as e:
+        # 실패한 채널은 flush 에서 기록됨 → 해당 작업의 다음 publish 에서 예외 발생
+        logger.error(f"❌ Stream flush failed: {e}")
+
+def resolve_stream_channel(raw_user_uuid: str, session_id: str, job_id: str) -> str:
+  """
+  전송 방식에 따른 채널(또는 스트림 키) 이름
+  """
+  if settings.CHAT_STREAM_TRANSPORT == "stream":
+    return f"chat:stream:{raw_user_uuid}-{session_id}:{job_id}"
+  return f"chat:stream:{raw_user_uuid}-{session_id}"
+
+stream_publisher = StreamPublisher()
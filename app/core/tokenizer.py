@@ -0,0 +1,37 @@
+import logging
+import tiktoken
+from core.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+_encoding = None
+_encoding_failed = False
+
+def get_encoding():
+  """
+  tiktoken 인코딩 (최초 1회 로드, BPE 파일을 받을 수 없으면 None → 근사치 사용)
+  """
+  global _encoding, _encoding_failed
+
+  if _encoding is None and not _encoding_failed:
+    try:
+      _encoding = tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+    except Exception as e:
+      _encoding_failed = True
+      logger.warning(f"⚠️ Tokenizer '{settings.TOKENIZER_ENCODING}' unavailable, using byte-length estimate: {e}")
+
+  return _encoding
+
+def count_tokens(text: str) -> int:
+  """
+  토큰 수 계산
+  - 인코딩이 없으면 UTF-8 바이트 / 3 으로 근사 (한글 1글자 ≈ 1토큰, 영문 3~4글자 ≈ 1토큰)
+  """
+  if not text:
+    return 0
+
+  encoding = get_encoding()
+  if encoding is not None:
+    return len(encoding.encode(text, disallowed_special=()))
+
+  return max(1, len(text.encode("utf-8")) // 3)
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime
+from sqlalchemy import String, any_, bindparam, delete, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from pgvector import Vector
+from core.database import AsyncSessionLocal
+from core.vectorized_doc import VectorizedDoc
+
+logger = logging.getLogger("uvicorn")
+
+# COPY 대상 컬럼 (순서 = 레코드 튜플 순서)
+COPY_COLUMNS = (
+  "id",
+  "chunk_index",
+  "content",
+  "meta_data",
+  "token_count",
+  "embedding",
+  "embedding_model",
+  "knowledge_doc_id",
+  "uploader_id",
+  "content_hash",
+  "created_at",
+)
+
+def compute_chunk_hash(content: str, embedding_model: str) -> str:
+  """
+  임베딩 모델이 바뀌면 같은 내용이라도 다시 임베딩하도록 모델명을 포함
+  """
+  return hashlib.sha256(f"{embedding_model}\n{content}".encode("utf-8")).hexdigest()
+
+def to_copy_record(doc: VectorizedDoc) -> tuple:
+  """
+  VectorizedDoc → COPY 레코드 튜플 (JSONB 는 문자열, vector 는 바이너리 코덱이 처리)
+  - COPY 는 ORM flush 를 거치지 않으므로 컬럼 default 를 여기서 채움
+  """
+  return (
+    doc.id if doc.id else str(uuid.uuid4()),
+    doc.chunk_index,
+    doc.content,
+    json.dumps(doc.meta_data, ensure_ascii=False),
+    doc.token_count if doc.token_count is not None else 0,
+    doc.embedding,
+    doc.embedding_model,
+    doc.knowledge_doc_id,
+    doc.uploader_id,
+    doc.content_hash,
+    doc.created_at if doc.created_at else datetime.utcnow(),
+  )
+
+async def copy_vectorized_docs(db: AsyncSession, docs: list[VectorizedDoc]):
+  """
+  asyncpg copy_records_to_table (바이너리 COPY) 로 vectorized_docs 에 일괄 적재
+  - 현재 세션의 트랜잭션 안에서 실행됨
+  - vector 바이너리 코덱은 COPY 동안만 등록 (ORM 은 텍스트 형식으로 바인딩하므로 끝나면 원복)
+  """
+  if not docs:
+    return
+
+  conn = await db.connection()
+  raw_conn = await conn.get_raw_connection()
+  driver_conn = raw_conn.driver_connection
+
+  # asyncpg 어댑터는 첫 SQL 실행 시점에 트랜잭션을 시작하므로,
+  # COPY 가 먼저 나가면 autocommit 되어 롤백되지 않음 → 트랜잭션을 먼저 열어둠
+  if not driver_conn.is_in_transaction():
+    await conn.execute(text("SELECT 1"))
+
+  await driver_conn.set_type_codec(
+    "vector",
+    schema="public",
+    encoder=lambda value: (value if isinstance(value, Vector) else Vector(value)).to_binary(),
+    decoder=Vector.from_binary,
+    format="binary",
+  )
+  try:
+    await driver_conn.copy_records_to_table(
+      VectorizedDoc.__tablename__,
+      records=[to_copy_record(doc) for doc in docs],
+      columns=COPY_COLUMNS,
+    )
+  finally:
+    await driver_conn.reset_type_codec("vector", schema="public")
+
+async def load_existing_chunks(doc_id: str) -> list:
+  """
+  문서의 기존 청크 (임베딩 제외, 비교에 필요한 컬럼만)
+  """
+  async with AsyncSessionLocal() as db:
+    result = await db.execute(
+      select(
+        VectorizedDoc.id,
+        VectorizedDoc.content_hash,
+        VectorizedDoc.chunk_index,
+        VectorizedDoc.meta_data,
+      )
+      .where(VectorizedDoc.knowledge_doc_id == doc_id)
+      .order_by(VectorizedDoc.chunk_index)
+    )
+    return list(result.all())
+
+class ChunkMatcher:
+  """
+  재업로드 시 기존 청크와 새 청크를 content_hash 로 비교 (청크가 나오는 순서대로 호출)
+  - 같은 내용이 여러 번 나오는 경우도 개수만큼 매칭
+  - 매칭된 기존 행은 임베딩 재사용, 끝까지 매칭되지 않은 행은 stale
+  """
+
+  def __init__(self, existing_rows: list):
+    self.existing_rows = existing_rows
+    self.kept_count = 0
+    self._pool: dict[str, deque] = defaultdict(deque)
+    self._kept_ids = set()
+    for row in existing_rows:
+      if row.content_hash:
+        self._pool[row.content_hash].append(row)
+
+  def match(self, content_hash: str):
+    """
+    같은 내용의 기존 행 (없으면 None → 새로 임베딩)
+    """
+    if not self._pool[content_hash]:
+      return None
+    row = self._pool[content_hash].popleft()
+    self._kept_ids.add(row.id)
+    self.kept_count += 1
+    return row
+
+  def stale_ids(self) -> list[str]:
+    return [row.id for row in self.existing_rows if row.id not in self._kept_ids]
+
+class DocumentChunkWriter:
+  """
+  문서 청크를 받는 대로 COPY 로 적재하고, 마지막에 stale 삭제 / 유지 행 갱신과 함께 커밋
+  - 전체가 단일 트랜잭션 → 실패 시 새 청크도 남지 않고, 커밋 전까지 검색에는 기존 청크만 보임
+  - 커밋하지 않고 닫히면 롤백
+  """
+
+  def __init__(self, doc_id: str):
+    self.doc_id = doc_id
+    self.inserted = 0
+    self._db: AsyncSession | None = None
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc):
+    await self.close()
+
+  def _session(self) -> AsyncSession:
+    if self._db is None:
+      self._db = AsyncSessionLocal()
+    return self._db
+
+  async def copy(self, docs: list[VectorizedDoc]):
+    if not docs:
+      return
+    await copy_vectorized_docs(self._session(), docs)
+    self.inserted += len(docs)
+
+  async def commit(self, stale_ids: list[str], kept_updates: list[dict]):
+    """
+    - stale 행 삭제
+    - 유지되는 행은 위치/메타데이터가 바뀐 경우만 갱신 (임베딩은 그대로)
+    """
+    db = self._session()
+    if stale_ids:
+      # IN (...) 은 id 마다 바인드 파라미터가 생겨 큰 문서에서 asyncpg 상한(32767)을 넘음 → 배열 파라미터 하나로
+      await db.execute(
+        delete(VectorizedDoc)
+        .where(VectorizedDoc.knowledge_doc_id == self.doc_id)
+        .where(VectorizedDoc.id == any_(bindparam("stale_ids", stale_ids, type_=ARRAY(String))))
+      )
+    if kept_updates:
+      await db.execute(update(VectorizedDoc), kept_updates)
+    await db.commit()
+
+    logger.info(
+      f"💾 Synced chunks for {self.doc_id}: -{len(stale_ids)} / ~{len(kept_updates)} / +{self.inserted} rows"
+    )
+
+  async def close(self):
+    if self._db is not None:
+      await self._db.close()
+      self._db = None
@@ -1,7 +1,8 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import deferred
 from pgvector.sqlalchemy import Vector  # pgvector 필수
 from core.database import Base
 
@@ -17,8 +18,21 @@ class VectorizedDoc(Base):
 
   embedding = Column(Vector(1536))
   embedding_model = Column(String, default="openrouter/text-embedding-3-small")
+  # sha256(임베딩 모델 + 청크 내용), 재업로드 시 바뀐 청크만 다시 임베딩하기 위한 비교 키
+  content_hash = Column(String(64), nullable=True)
+  # 하이브리드 검색(전문 검색)용, 'simple' 설정 = 형태소 분석 없이 소문자 토큰 (한국어 고유명사 그대로 유지)
+  # 값은 트리거가 채움 (migrations.add_content_tsv_column), 조회할 일이 없으므로 기본 로딩에서 제외
+  content_tsv = deferred(Column(TSVECTOR, nullable=True))
 
   knowledge_doc_id = Column(String, nullable=False)
   uploader_id = Column(String, nullable=False)
 
-  created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+  created_at = Column(DateTime, default=datetime.utcnow)
+
+  __table_args__ = (
+    Index("idx_vectorized_docs_doc_hash", "knowledge_doc_id", "content_hash"),
+    Index("idx_vectorized_docs_content_tsv", "content_tsv", postgresql_using="gin"),
+    # 검색 범위 필터 (knowledge_doc_id 는 doc_hash 인덱스의 선두 컬럼으로 처리)
+    Index("idx_vectorized_docs_uploader", "uploader_id"),
+    Index("idx_vectorized_docs_meta", "meta_data", postgresql_using="gin", postgresql_ops={"meta_data": "jsonb_path_ops"}),
+  )
\ No newline at end of file
@@ -1,19 +1,29 @@
 import asyncio
 import json
 import logging
+import socket
+import time
 import uuid
 from datetime import datetime
+from redis.exceptions import ResponseError
 from core.config import settings
 
 # 기존 Import
 from core.redis import get_redis_client
-from core.ai import generate_response_stream
+from core.ai import generate_response_stream, generate_summary
 
 # DB 및 서비스 Import
 from core.database import AsyncSessionLocal 
-from core.services import save_user_message, save_initial_response, get_session_history
+from core.services import save_user_message_with_history, save_initial_response, update_message_with_summary, history_content
 from .models import Message, MessageRole, ProcessingStatus
-from core.rag_service import search_similar_docs, format_rag_context
+from core.rag_service import search_similar_docs, SearchFilters
+from core.prompt_builder import assemble_prompt
+from core.tokenizer import count_tokens
+from core import semantic_cache
+from core.stream_publisher import stream_publisher, resolve_stream_channel
+from core.concurrency import AdaptiveLimiter
+from core.metrics import track_stage, CHAT_TIME_TO_FIRST_TOKEN_SECONDS, DLQ_EVENTS
+from core.loop_monitor import job_task_name
 
 
 logger = logging.getLogger("uvicorn")
@@ -21,8 +31,12 @@ logger = logging.getLogger("uvicorn")
 TARGET_TPS = 100
 TEST_DELAY = 1 / TARGET_TPS
 
-MAX_CONCURRENT_JOBS = 100
-semaphore = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+limiter = AdaptiveLimiter(
+    "chat",
+    initial=settings.CHAT_CONCURRENCY_INITIAL,
+    min_limit=settings.CHAT_CONCURRENCY_MIN,
+    max_limit=settings.CHAT_CONCURRENCY_MAX,
+)
 
 async def process_chat_job(job_id: str, redis_client): 
     """
@@ -61,66 +75,86 @@ async def process_chat_job(job_id: str, redis_client):
 
         prompt = task_data.get("content")
         base_context = task_data.get("context", "")
+        # RAG 검색 범위 (선택) : {"uploaderId", "docIds", "category"}
+        search_filters = SearchFilters.from_payload(task_data.get("searchFilters"))
 
         timestamp = task_data.get("timestamp")
 
         logger.info(f"🤖 Processing Job {job_id} | User: {raw_user_uuid} | Session: {session_id}")
 
-        # RAG 검색 로직
-        rag_system_message=""
-
-        if mode in ['general']:
-            logger.info(f"🔍 [RAG] Searching docs for: '{prompt}'")
-            found_docs = await search_similar_docs(prompt)
-
-            if found_docs:
-                rag_context_str = format_rag_context(found_docs)
-                rag_system_message = f"""
-You are an intelligent assistant named Protostar.
-
-[Instructions]
-- Use the provided [Retrieved Knowledge] to answer the user's question accurately.
-- If the answer is found in the knowledge, cite the source keywords if possible.
-- If the answer is NOT in the knowledge, rely on your general knowledge but mention that "This information is not in the provided documents."
-- Respond in the same language as the user's question (Korean).
-
-[Retrieved Knowledge]
-{rag_context_str}
-"""         
-                logger.info("✅ [RAG] Context injected into system prompt.")
-            else:
-                logger.info("⚠️ [RAG] No relevant documents found.")    
-
-        final_system_context = f"{rag_system_message}\n\n{base_context}".strip()                
-        
-        user_msg = None
-
-        # 사용자 질문 DB 저장 
-        async with AsyncSessionLocal() as db:
-            try: 
-                user_msg = await save_user_message(
-                    db,
-                    user_uuid,
-                    session_id,
-                    prompt,
-                )
-                user_msg_id = user_msg.id
-            except Exception as e:
-                logger.error(f"❌ Error saving user message: {e}")
-                raise e
-
-        channel = f"chat:stream:{raw_user_uuid}-{session_id}"
+        async def retrieve():
+            """
+            의미 기반 응답 캐시 조회 (반복 질문이면 RAG + LLM 생략) → RAG 검색
+            - 캐시는 대화 기록이 없는 턴만 사용 (후속 질문은 앞 대화에 따라 답이 달라짐)
+            """
+            cached = None
+            if semantic_cache.is_eligible(mode, base_context, search_filters):
+                _, history = await turn_task
+                if not history:
+                    with track_stage("chat", "semantic_cache"):
+                        cached = await semantic_cache.lookup(prompt, mode)
+
+            # RAG 검색 로직
+            found_docs = []
+
+            if mode in ['general'] and not (cached and cached.answer):
+                logger.info(f"🔍 [RAG] Searching docs for: '{prompt}'")
+                with track_stage("chat", "rag_search"):
+                    found_docs = await search_similar_docs(prompt, filters=search_filters)
+
+                if found_docs:
+                    logger.info("✅ [RAG] Context injected into system prompt.")
+                else:
+                    logger.info("⚠️ [RAG] No relevant documents found.")    
+
+            return cached, found_docs
+
+        async def start_turn():
+            """
+            사용자 질문 DB 저장 + 대화 기록 조회 (세션 하나, 캐시 miss 여도 한 번의 왕복)
+            """
+            with track_stage("chat", "turn_start"):
+                async with AsyncSessionLocal() as db:
+                    try: 
+                        return await save_user_message_with_history(
+                            db,
+                            user_uuid,
+                            session_id,
+                            prompt,
+                        )
+                    except Exception as e:
+                        logger.error(f"❌ Error saving user message: {e}")
+                        raise e
+
+        # 검색과 질문 저장/기록 조회는 프롬프트 구성 전까지 서로 무관하므로 동시에 실행
+        # 하나가 실패하면 나머지를 취소하고 정리될 때까지 기다린 뒤 에러 전달
+        # (의미 기반 캐시를 쓰는 경우에만 캐시 조회가 대화 기록 조회를 기다림)
+        turn_task = asyncio.create_task(start_turn(), name=job_task_name("chat", job_id))
+        pre_llm_tasks = [
+            asyncio.create_task(retrieve(), name=job_task_name("chat", job_id)),
+            turn_task,
+        ]
+        try:
+            with track_stage("chat", "pre_llm"):
+                (cached, found_docs), (user_msg, past_messages) = await asyncio.gather(*pre_llm_tasks)
+        except BaseException:
+            for task in pre_llm_tasks:
+                task.cancel()
+            await asyncio.gather(*pre_llm_tasks, return_exceptions=True)
+            raise
+
+        channel = resolve_stream_channel(raw_user_uuid, session_id, job_id)
+
+        # message payload 공통부 (content 는 Publisher 가 채움)
+        message_base_payload = {
+            "uuid": raw_user_uuid,
+            "sessionId": session_id,
+            "timestamp": task_data.get("timestamp")
+        }
 
         # 테스트 모드
         if mode not in ['general', 'page_context']:
-            test_message_payload = {
-                "type": 'message',
-                "content": "T",
-                "uuid": raw_user_uuid,
-                "sessionId": session_id,
-                "timestamp": task_data.get("timestamp")
-            }
-            await redis_client.publish(channel, json.dumps(test_message_payload))
+            await stream_publisher.publish_token(channel, "T", message_base_payload)
 
             await asyncio.sleep(TEST_DELAY) 
 
@@ -132,50 +166,58 @@ You are an intelligent assistant named Protostar.
                 "timestamp": task_data.get("timestamp")
             }
             
-            await redis_client.publish(channel, json.dumps(done_payload))
+            await stream_publisher.publish_done(channel, done_payload)
             await redis_client.delete(task_key)
             logger.info(f"🗑️ [Test] Deleted task data for job: {job_id}")
             return
 
 
-        history_context = []
-        if user_msg:
-            async with AsyncSessionLocal() as db:
-                past_messages = await get_session_history(
-                    db,
-                    session_id,
-                    exclude_ids=[user_msg_id]
-                )
-                for msg in past_messages:
-                    final_content = msg.content_summary if msg.content_summary else msg.content_full
-
-                    role = "assistant" if msg.role == MessageRole.ASSISTANT else "user"
-
-                    history_context.append({
-                        "role": role,
-                        "content": final_content,
-                    })
-        # AI가 한 토큰(조각)를 줄 때마다 Redis로 즉시 발송
         # 토큰 수집 준비
         full_response_list = []
-        
-        async for token in generate_response_stream(
-            prompt, 
-            mode, 
-            final_system_context, 
-            history=history_context
-            ):
-            full_response_list.append(token)
-            message_payload = {
-                "type": 'message',
-                "content": token, # 전체 문장이 아닌 '조각'
-                "uuid": raw_user_uuid,
-                "sessionId": session_id,
-                "timestamp": task_data.get("timestamp")
-            }
-            # print(token)
-            # NestJS로 조각 발송
-            await redis_client.publish(channel, json.dumps(message_payload))
+        stream_usage = {}
+        prompt_tokens = 0
+        response_model = settings.OPENROUTER_MODEL
+
+        if cached and cached.answer:
+            # 캐시된 답변을 같은 발송 경로로 재생
+            await semantic_cache.replay(cached.answer, channel, message_base_payload)
+            full_response_list.append(cached.answer)
+            stream_usage = {"input": 0, "output": 0}
+            response_model = "semantic-cache"
+        else:
+            history_context = []
+            for msg in past_messages:
+                final_content = history_content(msg)
+
+                role = "assistant" if msg.role == MessageRole.ASSISTANT else "user"
+
+                history_context.append({
+                    "role": role,
+                    "content": final_content,
+                })
+            # 토큰 예산 안으로 프롬프트 구성 (오래된 기록 → 낮은 순위 문서 순으로 제거)
+            final_system_context, history_context, prompt_tokens = assemble_prompt(
+                prompt,
+                base_context,
+                found_docs,
+                history_context,
+            )
+
+            # AI가 준 토큰(조각)을 채널 버퍼에 모아 짧은 주기로 묶어서 발송
+            llm_started_at = time.perf_counter()
+            with track_stage("chat", "llm_stream"):
+                async for token in generate_response_stream(
+                    prompt, 
+                    mode, 
+                    final_system_context, 
+                    history=history_context,
+                    usage=stream_usage,
+                    ):
+                    if not full_response_list:
+                        CHAT_TIME_TO_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - llm_started_at)
+                    full_response_list.append(token)
+                    # NestJS로 조각 발송 (Coalescing)
+                    await stream_publisher.publish_token(channel, token, message_base_payload)
 
         done_payload = {
             "type": 'done',            # 완료 타입 (NestJS나 클라이언트에서 식별 가능)
@@ -184,37 +226,66 @@ You are an intelligent assistant named Protostar.
             "sessionId": session_id,
             "timestamp": datetime.now().isoformat()
         }
-        await redis_client.publish(channel, json.dumps(done_payload))
+        await stream_publisher.publish_done(channel, done_payload)
         logger.info(f"✅ Job {job_id} Finished & DONE signal sent.")
 
         # 답변 DB 1차 저장 
         full_response_text = "".join(full_response_list)
+        # Provider usage 우선, 없으면 로컬 토크나이저로 계산
         usage_data = {
-            "input": len(prompt),
-            "output": len(full_response_text),
-            "model": settings.OPENROUTER_MODEL
+            "input": stream_usage.get("input", prompt_tokens),
+            "output": stream_usage.get("output", count_tokens(full_response_text)),
+            "model": response_model
         }
-        async with AsyncSessionLocal() as db:
-            try:
-                saved_msg = await save_initial_response(
-                    db,
-                    user_uuid,
-                    session_id,
-                    full_response_text,
-                    usage_data,
-                )
-                logger.info(f"💾 Saved AI Response. MsgID: {saved_msg.id}")
 
+        # 인라인 요약 : 메모리에 있는 답변으로 바로 요약 시작 (캐시 저장 / 답변 저장과 동시에 진행)
+        summary_task = None
+        if settings.CHAT_INLINE_SUMMARY_ENABLED:
+            summary_task = asyncio.create_task(
+                generate_summary(full_response_text),
+                name=job_task_name("chat", job_id),
+            )
+
+        # 새로 생성한 답변은 의미 기반 캐시에 저장
+        if cached and not cached.answer:
+            await semantic_cache.store(cached, prompt, mode, full_response_text)
+
+        # 답변은 요약을 기다리지 않고 바로 저장 (다음 질문의 대화 기록에 바로 보이도록)
+        saved_msg = None
+        with track_stage("chat", "save_response"):
+            async with AsyncSessionLocal() as db:
+                try:
+                    saved_msg = await save_initial_response(
+                        db,
+                        user_uuid,
+                        session_id,
+                        full_response_text,
+                        usage_data,
+                    )
+                    logger.info(f"💾 Saved AI Response. MsgID: {saved_msg.id}")
+                except Exception as e:
+                    limiter.record_error(e)
+                    logger.error(f"⚠️ AI response save failed: {e}")
+
+        if saved_msg is None:
+            if summary_task:
+                summary_task.cancel()
+        elif summary_task and await save_inline_summary(summary_task, saved_msg.id, job_id):
+            logger.info(f"📝 Inline summary saved. MsgID: {saved_msg.id}")
+        else:
+            try:
                 await redis_client.rpush("chat:summary:queue", str(saved_msg.id))
                 logger.info(f"🔔 Triggered Summary for MsgID: {saved_msg.id}")
-
             except Exception as e:
-                logger.error(f"⚠️ AI response save failed: {e}")
+                logger.error(f"⚠️ Summary trigger failed: {e}")
 
         await redis_client.delete(task_key)
         logger.info(f"🗑️ Deleted task data for job: {job_id}")
         
     except Exception as e:
+        limiter.record_error(e)
+        DLQ_EVENTS.labels(job="chat").inc()
+
         # DLQ 구현 
         # Promtail 로 추적 중이니 식별자를 포함한 JSON 식의 출력 구현 
         error_payload = {
@@ -228,26 +299,206 @@ You are an intelligent assistant named Protostar.
         logger.error(json.dumps(error_payload, ensure_ascii=False))
         logger.error(f"❌ Error processing job {job_id}: {e}")  # 기존 에러 핸들링, 간단한 판단용
 
-async def run_worker():
+async def save_inline_summary(summary_task: asyncio.Task, message_id: uuid.UUID, job_id: str) -> bool:
+    """
+    인라인 요약 결과를 저장된 답변에 UPDATE (Summary Worker 와 같은 저장 경로)
+    - 시간 안에 끝나지 않거나 저장에 실패하면 False → 요약 큐로 넘김
+    """
+    try:
+        with track_stage("chat", "inline_summary"):
+            summary = await asyncio.wait_for(summary_task, settings.CHAT_INLINE_SUMMARY_TIMEOUT_SEC)
+            async with AsyncSessionLocal() as db:
+                await update_message_with_summary(db, message_id, summary["summary"], summary["usage"])
+        return True
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️ Inline summary timed out, falling back to summary queue: {job_id}")
+    except Exception as e:
+        logger.warning(f"⚠️ Inline summary failed, falling back to summary queue: {job_id} {e}")
+    return False
+
+async def ensure_job_group(redis_client):
+    """
+    chat:job:stream 소비자 그룹 생성 (이미 있으면 무시)
+    - 그룹 생성 이전에 쌓인 작업도 처리하도록 '0' 부터 읽음
+    """
+    try:
+        await redis_client.xgroup_create(
+            settings.CHAT_JOB_STREAM,
+            settings.CHAT_JOB_GROUP,
+            id="0",
+            mkstream=True,
+        )
+        logger.info(f"✅ Consumer group '{settings.CHAT_JOB_GROUP}' created on '{settings.CHAT_JOB_STREAM}'")
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def keep_job_claimed(redis_client, consumer_name: str, entry_id: str):
+    """
+    처리 중인 작업의 PEL idle 시간을 주기적으로 0 으로 되돌림 (XCLAIM ... JUSTID)
+    - 오래 걸리는 작업이 CHAT_JOB_CLAIM_IDLE_MS 를 넘겨 다른 소비자에게 회수(중복 처리)되지 않도록
+    """
+    while True:
+        await asyncio.sleep(settings.CHAT_JOB_CLAIM_HEARTBEAT_SEC)
+        try:
+            await redis_client.xclaim(
+                settings.CHAT_JOB_STREAM,
+                settings.CHAT_JOB_GROUP,
+                consumer_name,
+                min_idle_time=0,
+                message_ids=[entry_id],
+                justid=True,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to refresh chat job claim: {entry_id} {e}")
+
+async def process_stream_job(entry_id: str, fields: dict, redis_client, consumer_name: str):
+    """
+    스트림 작업 처리 후 XACK
+    - 처리 도중 Pod 가 죽으면 ACK 되지 않은 채 PEL 에 남아 다른 소비자가 회수함
+    - 처리하는 동안은 keep_job_claimed 로 소유권 유지
+    - process_chat_job 내부 실패는 DLQ 로그로 남기므로 정상 종료로 보고 ACK
+    """
+    job_id = fields.get("jobId")
+    heartbeat = asyncio.create_task(
+        keep_job_claimed(redis_client, consumer_name, entry_id),
+        name=job_task_name("chat", job_id),
+    )
+
+    try:
+        if job_id:
+            await process_chat_job(job_id, redis_client)
+        else:
+            logger.warning(f"⚠️ Stream entry without jobId: {entry_id}")
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+
+    await redis_client.xack(settings.CHAT_JOB_STREAM, settings.CHAT_JOB_GROUP, entry_id)
+
+async def remove_stale_consumers(redis_client, consumer_name: str):
+    """
+    재시작 / 스케일 인으로 사라진 소비자를 그룹에서 삭제
+    - PEL 이 남은 소비자는 XAUTOCLAIM 으로 회수된 뒤(pending 0) 다음 주기에 삭제
+    """
+    consumers = await redis_client.xinfo_consumers(settings.CHAT_JOB_STREAM, settings.CHAT_JOB_GROUP)
+
+    for consumer in consumers:
+        name = consumer["name"]
+        if isinstance(name, bytes):
+            name = name.decode()
+        if name == consumer_name or consumer["pending"] > 0:
+            continue
+        if consumer["idle"] < settings.CHAT_JOB_CONSUMER_IDLE_MS:
+            continue
+
+        await redis_client.xgroup_delconsumer(settings.CHAT_JOB_STREAM, settings.CHAT_JOB_GROUP, name)
+        logger.info(f"🧹 Removed stale chat job consumer: {name}")
+
+async def reclaim_stale_jobs(redis_client, consumer_name: str, start_id: str = "0-0") -> str:
+    """
+    CHAT_JOB_CLAIM_IDLE_MS 이상 ACK 되지 않은 작업(죽은 소비자의 작업)을 가져와 재처리
+    - 한 번에 최대 10건, 다음 호출에서 이어서 스캔할 커서를 반환
+    - 스캔이 한 바퀴 돌면(커서 0-0) 사라진 소비자 정리
+    """
+    next_id, entries, *_ = await redis_client.xautoclaim(
+        settings.CHAT_JOB_STREAM,
+        settings.CHAT_JOB_GROUP,
+        consumer_name,
+        min_idle_time=settings.CHAT_JOB_CLAIM_IDLE_MS,
+        start_id=start_id,
+        count=10,
+    )
+
+    for entry_id, fields in entries:
+        if not fields:
+            # 트리밍 등으로 본문이 사라진 항목은 ACK 만 하고 넘어감
+            await redis_client.xack(settings.CHAT_JOB_STREAM, settings.CHAT_JOB_GROUP, entry_id)
+            continue
+
+        logger.warning(f"♻️ Reclaimed stale chat job: {entry_id} {fields}")
+        await limiter.acquire()
+        task = asyncio.create_task(
+            process_stream_job(entry_id, fields, redis_client, consumer_name),
+            name=job_task_name("chat", fields.get("jobId")),
+        )
+        limiter.attach(task)
+
+    if next_id in ("0-0", b"0-0"):
+        try:
+            await remove_stale_consumers(redis_client, consumer_name)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to remove stale chat job consumers: {e}")
+
+    return next_id
+
+async def run_stream_worker(redis_client, consumer_name: str):
+    """
+    chat:job:stream 을 XREADGROUP 으로 소비하는 루프 (CHAT_JOB_INTAKE=stream)
+    """
+    await ensure_job_group(redis_client)
+    claim_cursor = "0-0"
+    last_claimed_at = 0.0
+
+    while True:
+        if time.monotonic() - last_claimed_at > settings.CHAT_JOB_CLAIM_INTERVAL_SEC:
+            claim_cursor = await reclaim_stale_jobs(redis_client, consumer_name, claim_cursor)
+            last_claimed_at = time.monotonic()
+
+        await limiter.acquire()
+
+        result = await redis_client.xreadgroup(
+            settings.CHAT_JOB_GROUP,
+            consumer_name,
+            {settings.CHAT_JOB_STREAM: ">"},
+            count=1,
+            block=5000,
+        )
+
+        if result:
+            _, entries = result[0]
+            entry_id, fields = entries[0]
+            task = asyncio.create_task(
+                process_stream_job(entry_id, fields, redis_client, consumer_name),
+                name=job_task_name("chat", fields.get("jobId")),
+            )
+            limiter.attach(task)
+        else:
+            limiter.release()
+
+async def run_worker(consumer_name: str = None):
     """
     백그라운드에서 실행되며 Redis Queue(chat:job:queue)를 지속적으로 확인하는 루프 
+    - CHAT_JOB_INTAKE=stream 이면 chat:job:stream 소비자 그룹으로 동작 (consumer_name 으로 식별)
+    - consumer_name 미지정 시 CHAT_JOB_CONSUMER_NAME → 호스트명(Pod 이름) 순, 재시작해도 같은 이름
     """
-    logger.info("🚀 Protostar Worker started. Listening to 'chat:job:queue'...")
     redis_client = get_redis_client()
+
+    if settings.CHAT_JOB_INTAKE == "stream":
+        consumer_name = consumer_name or settings.CHAT_JOB_CONSUMER_NAME or socket.gethostname()
+        logger.info(f"🚀 Protostar Worker started. Consuming '{settings.CHAT_JOB_STREAM}' as '{consumer_name}'...")
+    else:
+        logger.info("🚀 Protostar Worker started. Listening to 'chat:job:queue'...")
     
     try:
+        if settings.CHAT_JOB_INTAKE == "stream":
+            await run_stream_worker(redis_client, consumer_name)
+
         while True:
 
-            await semaphore.acquire()
+            await limiter.acquire()
             
             result = await redis_client.brpop("chat:job:queue", timeout=5)
 
             if result:
                 _, job_id = result 
-                task = asyncio.create_task(process_chat_job(job_id, redis_client))
-                task.add_done_callback(lambda t: semaphore.release())
+                task = asyncio.create_task(
+                    process_chat_job(job_id, redis_client),
+                    name=job_task_name("chat", job_id),
+                )
+                limiter.attach(task)
             else:
-                semaphore.release()
+                limiter.release()
                 await asyncio.sleep(0.0001)
     
     except asyncio.CancelledError:
@@ -255,5 +506,7 @@ async def run_worker():
     except Exception as e:
         logger.error(f"❌ Worker crashed: {e}")
     finally:
+        # 진행 중인 작업이 redis_client / 공유 HTTP 클라이언트를 쓰고 있으므로 먼저 정리
+        await limiter.drain(settings.WORKER_SHUTDOWN_DRAIN_TIMEOUT_SEC)
         await redis_client.close()
             
\ No newline at end of file
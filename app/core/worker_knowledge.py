@@ -1,28 +1,40 @@
 # app/core/worker_knowledge.py
 import asyncio
+import hashlib
 import json
 import logging
-import httpx
 import re
-from openai import AsyncOpenAI
-from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+from contextlib import aclosing
 
 from core.config import settings
 from core.redis import get_redis_client
+from core.http_clients import clients
 from core.minio_client import minio_client
-from core.database import AsyncSessionLocal
 from core.vectorized_doc import VectorizedDoc
+from core.vector_store import (
+  compute_chunk_hash,
+  load_existing_chunks,
+  ChunkMatcher,
+  DocumentChunkWriter,
+)
+from core.embedding_cache import embedding_cache
+from core.embedding_batcher import embedding_batcher
+from core.knowledge_version import bump_knowledge_version
+from core.concurrency import AdaptiveLimiter
+from core.metrics import track_stage, DLQ_EVENTS
+from core.loop_monitor import job_task_name
+from core.chunking import HEADERS_TO_SPLIT_ON, MarkdownSectionStream, split_sections_async
 
 logger = logging.getLogger("uvicorn")
 
-MAX_CONCURRENT_JOBS = 3
-semaphore = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
-
-ai_client = AsyncOpenAI(
-  api_key=settings.OPENROUTER_API_KEY,
-  base_url="https://openrouter.ai/api/v1",
+limiter = AdaptiveLimiter(
+  "knowledge",
+  initial=settings.KNOWLEDGE_CONCURRENCY_INITIAL,
+  min_limit=settings.KNOWLEDGE_CONCURRENCY_MIN,
+  max_limit=settings.KNOWLEDGE_CONCURRENCY_MAX,
 )
 
+
 async def extract_metadata_from_llm(text_preview: str) -> dict:
   """
   문서 앞 부분을 읽고 메타 데이터를 추출 
@@ -37,7 +49,7 @@ async def extract_metadata_from_llm(text_preview: str) -> dict:
     Output JSON only. No markdown formatting.
     """
   try:
-    response = await ai_client.chat.completions.create(
+    response = await clients.openai.chat.completions.create(
       model=settings.OPENROUTER_MODEL,
       messages=[
         {"role": "system", "content": system_prompt},
@@ -65,17 +77,36 @@ async def extract_metadata_from_llm(text_preview: str) -> dict:
       }
 
 
-async def get_embeddings(text_chunks: list[str]) -> list[list[float]]:
+async def get_embeddings(text_chunks: list[str], use_cache: bool = True) -> list[list[float]]:
   """
   openRouter 에서 받아서 임베딩 생성
+  - 캐시(embedding_cache)에 있는 텍스트는 건너뛰고, 없는 텍스트만 요청
+  - 요청은 embedding_batcher 가 토큰 예산 단위로 나눠 동시 요청 + 재시도
+  - use_cache=False : 문서 적재용 (청크는 거의 재사용되지 않아 Redis / LRU 만 채우고 질문 임베딩을 밀어냄)
   """
   try:
-    response = await ai_client.embeddings.create(
-      model=settings.OPENROUTER_EMBEDDING_MODEL,
-      input=text_chunks,
-    )
+    model = settings.OPENROUTER_EMBEDDING_MODEL
+    if use_cache:
+      cached_vectors = await embedding_cache.get_many(model, text_chunks)
+    else:
+      cached_vectors = [None] * len(text_chunks)
 
-    return [data.embedding for data in response.data]
+    # 캐시 미스 텍스트 (중복 제거, 순서 유지)
+    missing_texts = list(dict.fromkeys(
+      text for text, vector in zip(text_chunks, cached_vectors) if vector is None
+    ))
+
+    fresh_vectors = {}
+    if missing_texts:
+      vectors = await embedding_batcher.embed(clients.openai, model, missing_texts)
+      fresh_vectors = dict(zip(missing_texts, vectors))
+      if use_cache:
+        await embedding_cache.set_many(model, fresh_vectors)
+
+    return [
+      vector if vector is not None else fresh_vectors[text]
+      for text, vector in zip(text_chunks, cached_vectors)
+    ]
   except Exception as e:
     logger.error(f"❌ OpenRouter Embedding Error: {e}")
     raise e
@@ -103,23 +134,214 @@ async def send_webhook(doc_id: str, status: str, result_meta: dict = None, error
       "Content-Type": "application/json"
   }
 
-  async with httpx.AsyncClient() as client:
-      try:
-          resp = await client.post(url, json=payload, headers=headers, timeout=10.0)
-          if resp.status_code in [200, 201]:
-              logger.info(f"🔔 Webhook Success: {doc_id} -> {status}")
-          else:
-              logger.error(f"⚠️ Webhook Failed: {resp.status_code} - {resp.text}")
-      except Exception as e:
-          logger.error(f"❌ Webhook Connection Error: {e}")
+  # 공유 클라이언트의 커넥션 풀 재사용 (timeout 은 WEBHOOK_TIMEOUT_SEC)
+  try:
+      resp = await clients.webhook.post(url, json=payload, headers=headers)
+      if resp.status_code in [200, 201]:
+          logger.info(f"🔔 Webhook Success: {doc_id} -> {status}")
+      else:
+          logger.error(f"⚠️ Webhook Failed: {resp.status_code} - {resp.text}")
+  except Exception as e:
+      logger.error(f"❌ Webhook Connection Error: {e}")
+
+# 파이프라인 단계 종료 신호
+_DONE = object()
+
+# 청크별 메타데이터(헤더) 키, 나머지는 문서 단위 메타데이터
+CHUNK_META_KEYS = {name for _, name in HEADERS_TO_SPLIT_ON}
+
+def stored_document_meta(existing_rows: list, preview_hash: str) -> dict | None:
+  """
+  문서 앞부분이 그대로면 이전에 추출한 문서 메타데이터 재사용
+  - LLM 추출 결과가 매번 조금씩 달라서, 재추출하면 바뀌지 않은 청크까지 전부 UPDATE 됨
+  """
+  for row in existing_rows:
+    meta = row.meta_data or {}
+    if meta.get("preview_hash") == preview_hash:
+      return {key: value for key, value in meta.items() if key not in CHUNK_META_KEYS}
+  return None
+
+class IngestionPipeline:
+  """
+  지식 문서 수집 파이프라인 : download → chunk → embed (N개 동시) → write
+  - 단계 사이는 bounded queue → 뒤 단계가 밀리면 앞 단계(다운로드 포함)가 기다림 (backpressure)
+  - 메타데이터 추출(LLM)은 문서 앞부분이 모이는 대로 다른 단계와 동시에 실행, 쓰기 단계만 결과를 기다림
+  - 전체 시간 ≈ 가장 느린 단계 (단계 합이 아님)
+  - 유지되는 청크의 위치/메타데이터 갱신은 모아뒀다가 마지막 커밋 때 반영
+  """
+
+  def __init__(self, doc_id: str, uploader_id: str, pieces, matcher: ChunkMatcher, writer: DocumentChunkWriter):
+    self.doc_id = doc_id
+    self.uploader_id = uploader_id
+    self.pieces = pieces
+    self.matcher = matcher
+    self.writer = writer
+    self.embedding_model = settings.OPENROUTER_EMBEDDING_MODEL
+    self.embed_workers = settings.KNOWLEDGE_PIPELINE_EMBED_WORKERS
+
+    queue_size = settings.KNOWLEDGE_PIPELINE_QUEUE_SIZE
+    self.section_queue = asyncio.Queue(maxsize=queue_size)
+    self.embed_queue = asyncio.Queue(maxsize=queue_size)
+    self.write_queue = asyncio.Queue(maxsize=queue_size)
+
+    self.section_stream = MarkdownSectionStream()
+    self.metadata_task: asyncio.Task | None = None
+    self._metadata_started = asyncio.Event()
+
+    self.kept: list[tuple] = [] # (기존 행, 새 청크 인덱스, 청크 메타데이터)
+    self.chunk_count = 0
+
+  async def run(self):
+    tasks = [
+      asyncio.create_task(self._read()),
+      asyncio.create_task(self._chunk()),
+      *[asyncio.create_task(self._embed()) for _ in range(self.embed_workers)],
+      asyncio.create_task(self._write()),
+    ]
+    try:
+      await asyncio.gather(*tasks)
+    except BaseException:
+      # 한 단계가 실패하면 나머지 단계(큐에서 대기 중)도 정리
+      # 다운로드 iterator 를 닫기 전에 읽기 단계가 완전히 멈출 때까지 기다림
+      if self.metadata_task:
+        tasks.append(self.metadata_task)
+      for task in tasks:
+        task.cancel()
+      await asyncio.gather(*tasks, return_exceptions=True)
+      raise
+
+  def kept_updates(self, extracted_meta: dict) -> list[dict]:
+    updates = []
+    for row, idx, chunk_meta in self.kept:
+      combined_meta = {**chunk_meta, **extracted_meta}
+      if row.chunk_index != idx or row.meta_data != combined_meta:
+        updates.append({
+          "id": row.id,
+          "chunk_index": idx,
+          "meta_data": combined_meta,
+        })
+    return updates
+
+  async def extracted_meta(self) -> dict:
+    await self._metadata_started.wait()
+    return await self.metadata_task
+
+  def _start_metadata(self):
+    if self.metadata_task is None:
+      self.metadata_task = asyncio.create_task(self._extract_metadata(self.section_stream.preview))
+      self._metadata_started.set()
+
+  async def _extract_metadata(self, preview: str) -> dict:
+    preview_hash = hashlib.sha256(preview.encode("utf-8")).hexdigest()
+    stored_meta = stored_document_meta(self.matcher.existing_rows, preview_hash)
+    if stored_meta is not None:
+      logger.info("♻️ Document preview unchanged, reusing stored metadata")
+      return stored_meta
+
+    logger.info("🏷️ Extracting Metadata via LLM...")
+    with track_stage("knowledge", "metadata_llm"):
+      extracted_meta = await extract_metadata_from_llm(preview)
+    logger.info(f"🏷️ Extracted: {extracted_meta}")
+
+    # 추출에 실패한 결과는 재사용하지 않도록 해시를 남기지 않음
+    if extracted_meta.get("summary") != "failed":
+      extracted_meta = {**extracted_meta, "preview_hash": preview_hash}
+    return extracted_meta
+
+  async def _read(self):
+    """
+    MinIO 조각 → 완성된 헤더 섹션
+    - 디코딩 + 줄 단위 헤더 스캔은 조각당 100ms 가량 걸리므로 스레드에서 실행 (채팅 스트리밍을 막지 않음)
+    """
+    async for piece in self.pieces:
+      sections = await asyncio.to_thread(self.section_stream.feed, piece)
+      if self.section_stream.preview_ready:
+        self._start_metadata()
+      if sections:
+        await self.section_queue.put(sections)
+
+    if self.section_stream.bytes_read == 0:
+      raise ValueError("File content is empty")
+
+    sections = await asyncio.to_thread(self.section_stream.finish)
+    self._start_metadata()
+    if sections:
+      await self.section_queue.put(sections)
+    await self.section_queue.put(_DONE)
+
+  async def _chunk(self):
+    """
+    섹션 → 청크, 기존 청크와 비교해서 새 청크만 임베딩 단계로
+    """
+    while (sections := await self.section_queue.get()) is not _DONE:
+      with track_stage("knowledge", "chunking"):
+        chunks = await split_sections_async(sections)
+
+      new_chunks = []
+      for chunk in chunks:
+        idx = self.chunk_count
+        self.chunk_count += 1
+        content_hash = compute_chunk_hash(chunk.content, self.embedding_model)
+
+        row = self.matcher.match(content_hash)
+        if row is None:
+          new_chunks.append((idx, chunk, content_hash))
+        else:
+          self.kept.append((row, idx, chunk.metadata))
+
+      if new_chunks:
+        await self.embed_queue.put(new_chunks)
+
+    for _ in range(self.embed_workers):
+      await self.embed_queue.put(_DONE)
+
+  async def _embed(self):
+    while (new_chunks := await self.embed_queue.get()) is not _DONE:
+      with track_stage("knowledge", "embedding"):
+        # 변경 없는 청크는 content_hash 로 이미 재사용 → 임베딩 캐시 생략
+        embeddings = await get_embeddings([chunk.content for _, chunk, _ in new_chunks], use_cache=False)
+      await self.write_queue.put(list(zip(new_chunks, embeddings)))
+
+    await self.write_queue.put(_DONE)
+
+  async def _write(self):
+    """
+    임베딩된 청크 → COPY (하나의 열린 트랜잭션, 커밋은 파이프라인이 끝난 뒤)
+    """
+    remaining = self.embed_workers
+    while remaining:
+      batch = await self.write_queue.get()
+      if batch is _DONE:
+        remaining -= 1
+        continue
+
+      extracted_meta = await self.extracted_meta()
+      vector_docs = []
+      for (idx, chunk, content_hash), vector in batch:
+        vector_docs.append(VectorizedDoc(
+          chunk_index=idx,
+          content=chunk.content,
+          meta_data={
+            **chunk.metadata, # 
+            **extracted_meta,
+          },
+          token_count=len(chunk.content),
+          embedding=vector,
+          embedding_model=self.embedding_model,
+          knowledge_doc_id=self.doc_id,
+          uploader_id=self.uploader_id,
+          content_hash=content_hash,
+        ))
+
+      with track_stage("knowledge", "db_copy"):
+        await self.writer.copy(vector_docs)
 
 async def process_knowledge_job(payload_json: str):
   """
   로직 정리
   1. Payload 파싱
-  2. MinIO 다운로드
-  3. RAG 벡터화 (TODO)
-  4. 결과 Webhook 전송
+  2. MinIO 스트리밍 다운로드 → 청킹 → 임베딩 → 적재 (IngestionPipeline)
+  3. 결과 Webhook 전송
   """
   doc_id = None
   try:
@@ -130,95 +352,62 @@ async def process_knowledge_job(payload_json: str):
       bucket_name = task_data.get("minioBucket")
       # mime_type = task_data.get("mimeType")
 
+      # 큐에서 꺼낼 때는 payload 를 파싱하지 않으므로 여기서 doc_id 로 Task 이름 지정
+      asyncio.current_task().set_name(job_task_name("knowledge", doc_id))
+
       logger.info(f"📚 [Start] RAG Job | DocID: {doc_id}")
 
-      # 2. MinIO 파일 다운로드
-      logger.info(f"📥 Downloading: {minio_key} ({bucket_name})")
-      file_content = await minio_client.get_file_content(
-          object_name=minio_key, 
-          bucket_name=bucket_name
-      )
-      
-      if not file_content:
-          raise ValueError("File content is empty")
-
-      text_content = file_content.decode("utf-8")
-
-      file_size_kb = len(file_content) / 1024
-      logger.info(f"✅ Downloaded: {file_size_kb:.2f} KB")
-      logger.info("🏷️ Extracting Metadata via LLM...")
-      extracted_meta = await extract_metadata_from_llm(text_content)
-      logger.info(f"🏷️ Extracted: {extracted_meta}")
-
-      # 3. 천킹 (헤더 기준, 문자수 기준)
-      # 3-1. 헤더 기준 크게 자르기 
-      headers_to_split_on = [
-        ("#", "Header 1"),
-        ("##", "Header 2"),
-        ("###", "Header 3"),
-        ("####", "Header 4"),
-      ]
-      markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-      md_header_splits = markdown_splitter.split_text(text_content)
-      
-      # 3-2. 문자수 기준 작은 단위로 재귀 자르기
-      text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-      )
-      final_chunks = text_splitter.split_documents(md_header_splits)
+      # 2. 기존 청크 (재업로드 시 바뀐 청크만 임베딩하기 위한 비교 대상)
+      with track_stage("knowledge", "load_existing"):
+        existing_rows = await load_existing_chunks(doc_id)
+      matcher = ChunkMatcher(existing_rows)
 
-      chunk_texts = [chunk.page_content for chunk in final_chunks]
-      logger.info(f"🧩 Chunking Complete: {len(chunk_texts)} chunks generated.")
+      # 3. MinIO 스트리밍 다운로드 → 청킹 → 임베딩 → 적재를 파이프라인으로 동시에 진행
+      # 파일 전체를 메모리에 올리지 않고, 새 청크는 열린 트랜잭션에 바로 COPY
+      logger.info(f"📥 Streaming: {minio_key} ({bucket_name})")
 
-      # 4. 임베딩 생성
-      embeddings = await get_embeddings(chunk_texts)
-      logger.info(f"🧠 Embedding Complete: {len(embeddings)} vectors generated.")
+      async with (
+        aclosing(minio_client.iter_file_content(minio_key, bucket_name)) as pieces,
+        DocumentChunkWriter(doc_id) as writer,
+      ):
+        pipeline = IngestionPipeline(doc_id, task_data.get("uploaderId"), pieces, matcher, writer)
+        with track_stage("knowledge", "pipeline"):
+          await pipeline.run()
 
-      # 5. DB 저장
-      # async with AsyncSessionLocal() as db:
-      vector_docs = []
-      for idx, (chunk_obj, vector) in enumerate(zip(final_chunks, embeddings)):
-        combined_meta = {
-          **chunk_obj.metadata, # 
-          **extracted_meta,
-        }
+        file_size_kb = pipeline.section_stream.bytes_read / 1024
+        logger.info(f"✅ Downloaded: {file_size_kb:.2f} KB")
+        logger.info(f"🧩 Chunking Complete: {pipeline.chunk_count} chunks generated.")
 
-        vector_docs.append(VectorizedDoc(
-          chunk_index=idx,
-          content=chunk_obj.page_content,
-          meta_data=combined_meta,
-          token_count=len(chunk_obj.page_content),
-          embedding=vector,
-          embedding_model=settings.OPENROUTER_EMBEDDING_MODEL,
-          knowledge_doc_id=doc_id,
-          uploader_id=task_data.get("uploaderId")
-        ))
-      # db.add_all(vector_docs)
-      # await db.commit()
-      # logger.info(f"💾 DB Insert Complete: {len(vector_docs)} rows.")
-
-      async with AsyncSessionLocal() as db:
-        try:
-            db.add_all(vector_docs)
-            await db.commit()
-            logger.info(f"💾 DB Insert Complete: {len(vector_docs)} rows.")
-        except Exception as e:
-            await db.rollback() # 에러 나면 롤백
-            raise e # 에러 다시 던져서 바깥 try-except에 잡히게 함
+        stale_ids = matcher.stale_ids()
+        logger.info(
+          f"🔁 Chunk Diff: kept {matcher.kept_count} / new {writer.inserted} / stale {len(stale_ids)}"
+        )
+
+        # 삭제 / 갱신을 COPY 적재와 같은 트랜잭션으로 커밋
+        # 실패 시 롤백 후 에러를 다시 던져서 바깥 try-except에 잡히게 함
+        kept_updates = pipeline.kept_updates(await pipeline.extracted_meta())
+        with track_stage("knowledge", "db_sync"):
+          await writer.commit(stale_ids, kept_updates)
+        logger.info(f"💾 DB Sync Complete: {writer.inserted} rows inserted.")
+
+      # 지식 베이스 내용이 바뀌었으면 버전 증가 → 이전 버전 기준의 의미 기반 캐시 무효화
+      if writer.inserted or stale_ids:
+        await bump_knowledge_version()
       
       # 6. 성공 Webhook
       await send_webhook(
           doc_id=doc_id, 
           status="COMPLETED", 
           result_meta={
-            "chunkCount": len(final_chunks),
+            "chunkCount": pipeline.chunk_count,
             "embeddingModel": settings.OPENROUTER_EMBEDDING_MODEL,
           }
       )
       logger.info(f"✅ Job Finished: {doc_id}")
 
   except Exception as e:
+      limiter.record_error(e)
+      DLQ_EVENTS.labels(job="knowledge").inc()
       logger.error(f"❌ Job Failed ({doc_id}): {e}")
       # 실패 Webhook (doc_id가 있을 때만)
       if doc_id:
@@ -237,7 +426,7 @@ async def run_knowledge_worker():
   
   try:
       while True:
-          await semaphore.acquire()
+          await limiter.acquire()
           
           # NestJS가 넣는 큐 이름과 일치해야 함
           result = await redis_client.brpop("ai:job:queue", timeout=5)
@@ -250,13 +439,17 @@ async def run_knowledge_worker():
                   payload = payload.decode('utf-8')
               
               # 비동기 Task 실행
-              task = asyncio.create_task(process_knowledge_job(payload))
-              task.add_done_callback(lambda t: semaphore.release())
+              task = asyncio.create_task(
+                  process_knowledge_job(payload),
+                  name=job_task_name("knowledge", "pending"),
+              )
+              limiter.attach(task)
           else:
-              semaphore.release()
+              limiter.release()
               await asyncio.sleep(0.1)
 
   except asyncio.CancelledError:
       logger.info("🛑 Worker Cancelled")
   finally:
+      await limiter.drain(settings.WORKER_SHUTDOWN_DRAIN_TIMEOUT_SEC)
       await redis_client.close()
\ No newline at end of file
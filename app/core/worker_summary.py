@@ -1,15 +1,30 @@
 import asyncio
 import logging
+import time
 import uuid
+from core.config import settings
 from core.redis import get_redis_client
+from core.concurrency import AdaptiveLimiter
+from core.metrics import track_stage, DLQ_EVENTS
+from core.loop_monitor import job_task_name
 from core.database import AsyncSessionLocal
-from core.ai import generate_summary
-from core.services import get_message_by_id, update_message_with_summary
+from core.ai import generate_summary, generate_summaries
+from core.services import (
+  get_message_by_id,
+  get_messages_by_ids,
+  update_message_with_summary,
+  update_messages_with_summaries,
+)
 
 logger = logging.getLogger("uvicorn")
 
-MAX_CONCURRENT_SUMMARY = 50 # 요약이라 좀더 동시성 추가
-semaphore = asyncio.Semaphore(MAX_CONCURRENT_SUMMARY)
+# 요약이라 좀더 동시성 추가
+limiter = AdaptiveLimiter(
+  "summary",
+  initial=settings.SUMMARY_CONCURRENCY_INITIAL,
+  min_limit=settings.SUMMARY_CONCURRENCY_MIN,
+  max_limit=settings.SUMMARY_CONCURRENCY_MAX,
+)
 
 async def process_summary_job(msg_id_str: str):
   """
@@ -22,26 +37,88 @@ async def process_summary_job(msg_id_str: str):
     try:
       msg_id = uuid.UUID(msg_id_str)
 
-      message = await get_message_by_id(db, msg_id)
+      with track_stage("summary", "load_message"):
+        message = await get_message_by_id(db, msg_id)
       if not message:
         logger.warning(f"⚠️ Summary target not found: {msg_id}")
         return
 
       logger.info(f"📝 Summarizing Msg: {msg_id} (Length: {len(message.content_full)})")
 
-      result = await generate_summary(message.content_full)
+      with track_stage("summary", "llm"):
+        result = await generate_summary(message.content_full)
 
-      await update_message_with_summary(
-        db,
-        msg_id,
-        result["summary"],
-        result["usage"],
-      )
+      with track_stage("summary", "save"):
+        await update_message_with_summary(
+          db,
+          msg_id,
+          result["summary"],
+          result["usage"],
+        )
       logger.info(f"✅ Summary Complete: {msg_id}")
 
     except Exception as e:
+      limiter.record_error(e)
+      DLQ_EVENTS.labels(job="summary").inc()
       logger.error(f"❌ Summary Failed for {msg_id_str}: {e}")
 
+async def process_summary_batch(msg_id_strs: list[str]):
+  """
+  배치 모드 핵심 로직 (SUMMARY_BATCH_ENABLED)
+  1. WHERE id IN (...) 한 번으로 원본 메시지 확보
+  2. 짧은 답변은 bypass, 나머지는 묶어서 LLM 호출
+  3. bulk UPDATE 한 번으로 저장 + 히스토리 캐시 반영
+  """
+  msg_ids = []
+  for msg_id_str in msg_id_strs:
+    try:
+      msg_ids.append(uuid.UUID(msg_id_str))
+    except ValueError:
+      logger.warning(f"⚠️ Invalid summary target id: {msg_id_str}")
+
+  async with AsyncSessionLocal() as db:
+    try:
+      with track_stage("summary", "load_message"):
+        messages = await get_messages_by_ids(db, msg_ids)
+
+      missing = len(msg_ids) - len(messages)
+      if missing:
+        logger.warning(f"⚠️ Summary targets not found: {missing} of {len(msg_ids)}")
+      if not messages:
+        return
+
+      logger.info(f"📝 Summarizing batch of {len(messages)} messages")
+
+      with track_stage("summary", "llm"):
+        results = await generate_summaries([message.content_full for message in messages])
+
+      with track_stage("summary", "save"):
+        await update_messages_with_summaries(db, messages, results)
+      logger.info(f"✅ Summary batch complete: {len(messages)} messages")
+
+    except Exception as e:
+      limiter.record_error(e)
+      DLQ_EVENTS.labels(job="summary").inc(len(msg_id_strs))
+      logger.error(f"❌ Summary batch failed for {msg_id_strs}: {e}")
+
+async def drain_summary_batch(redis_client, batch: list[str]):
+  """
+  첫 id 가 담긴 batch 에 SUMMARY_BATCH_SIZE 개가 될 때까지 (최대 SUMMARY_BATCH_WAIT_MS) 추가로 꺼내 담음
+  - 호출한 쪽의 리스트에 바로 담으므로 도중에 취소 / 실패해도 이미 꺼낸 id 는 호출한 쪽에 남음
+  """
+  deadline = time.monotonic() + settings.SUMMARY_BATCH_WAIT_MS / 1000
+
+  while len(batch) < settings.SUMMARY_BATCH_SIZE:
+    items = await redis_client.rpop("chat:summary:queue", settings.SUMMARY_BATCH_SIZE - len(batch))
+    if items:
+      batch.extend(items)
+      continue
+
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+      break
+    await asyncio.sleep(min(remaining, 0.05))
+
 async def run_summary_worker():
   """
   요약 전용 큐(chat:summary:queue)를 구독하는 루프
@@ -52,7 +129,7 @@ async def run_summary_worker():
   try:
     while True: 
       
-      await semaphore.acquire()
+      await limiter.acquire()
 
       try: 
         result = await redis_client.brpop(
@@ -60,16 +137,35 @@ async def run_summary_worker():
           timeout=5
         )
 
-        if result:
+        if result and settings.SUMMARY_BATCH_ENABLED:
+          # 배치 하나가 슬롯 하나를 사용
+          _, msg_id_str = result
+          batch = [msg_id_str]
+          try:
+            await drain_summary_batch(redis_client, batch)
+          except Exception as e:
+            logger.warning(f"⚠️ Summary batch drain stopped early ({len(batch)} ids): {e}")
+          finally:
+            # 종료(취소) / rpop 실패여도 큐에서 꺼낸 id 는 처리 (PENDING 으로 남지 않도록)
+            # 취소된 경우에도 drain 단계에서 이 작업을 기다림
+            task = asyncio.create_task(
+              process_summary_batch(batch),
+              name=job_task_name("summary", f"batch-{msg_id_str}"),
+            )
+            limiter.attach(task)
+        elif result:
           _, msg_id_str = result
-          task = asyncio.create_task(process_summary_job(msg_id_str))
-          task.add_done_callback(lambda t: semaphore.release())
+          task = asyncio.create_task(
+            process_summary_job(msg_id_str),
+            name=job_task_name("summary", msg_id_str),
+          )
+          limiter.attach(task)
         else:
-          semaphore.release()
+          limiter.release()
           await asyncio.sleep(0.5)
         
       except Exception as e:
-        semaphore.release()
+        limiter.release()
         raise
 
   except asyncio.CancelledError:
@@ -77,4 +173,5 @@ async def run_summary_worker():
   except Exception as e:
     logger.error(f"❌ Summary Worker crashed: {e}") 
   finally:
+    await limiter.drain(settings.WORKER_SHUTDOWN_DRAIN_TIMEOUT_SEC)
     await redis_client.close()
\ No newline at end of file
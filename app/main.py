@@ -1,6 +1,8 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi import Response
 from fastapi.responses import StreamingResponse
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from core.redis import init_test_redis  
 from core.database import init_db
 from core.ai import generate_response_stream
@@ -12,6 +14,14 @@ from core.redis import get_redis_client
 from core.minio_client import minio_client
 from core.config import settings
 from core.worker_knowledge import run_knowledge_worker 
+from core.tokenizer import get_encoding
+from core.concurrency import limiters
+from core.metrics import run_metrics_sampler
+from core.loop_monitor import loop_monitor
+from core.chunking import warm_up_chunking_pool, shutdown_chunking_pool
+from core.http_clients import clients
+from core import semantic_cache
+from core.migrations import run_index_migrations
 
 import asyncio
 import uuid
@@ -29,13 +39,25 @@ async def main_lifespan(app: FastAPI): # context manager 패턴
     # 시작 시 Redis 연결 테스트
     await init_test_redis()
     await init_db()
+    # tiktoken BPE 파일 로드(최초 1회 다운로드)가 이벤트 루프를 막지 않도록 미리 로드
+    await asyncio.to_thread(get_encoding)
+    # 청킹 프로세스 풀 기동 (spawn + langchain import 비용을 첫 업로드 전에 처리)
+    await warm_up_chunking_pool()
+    # OpenRouter / webhook 공유 HTTP 클라이언트 (커넥션 풀 재사용)
+    clients.open()
     
     # await init_ai_context()
 
+    # 스트림 소비자 이름은 재시작해도 유지되는 Pod 이름 사용 (INSTANCE_ID 는 기동마다 바뀜)
     worker_task = asyncio.create_task(run_worker())
     summary_task = asyncio.create_task(run_summary_worker())
     health_task = asyncio.create_task(report_health_status_to_redis(INSTANCE_ID))
     rag_task = asyncio.create_task(run_knowledge_worker())
+    metrics_task = asyncio.create_task(run_metrics_sampler())
+    loop_monitor_task = asyncio.create_task(loop_monitor.run())
+    semantic_cache_task = asyncio.create_task(semantic_cache.run_purge_loop())
+    # ANN / 검색 인덱스는 기동을 막지 않도록 백그라운드에서 CONCURRENTLY 빌드
+    index_migration_task = asyncio.create_task(run_index_migrations())
     await minio_client.check_connection()
     
     logger.info(f"🚀 Protostar FastAPI Instance {INSTANCE_ID} Started & Reporting Health...")
@@ -46,6 +68,10 @@ async def main_lifespan(app: FastAPI): # context manager 패턴
     summary_task.cancel()
     health_task.cancel()
     rag_task.cancel()
+    metrics_task.cancel()
+    loop_monitor_task.cancel()
+    semantic_cache_task.cancel()
+    index_migration_task.cancel()
 
     # Graceful Shutdown - 종료 시 출석부에서 즉시 제거
     # 스코프 문제를 위하여 redis_client를 None으로 초기화
@@ -54,19 +80,30 @@ async def main_lifespan(app: FastAPI): # context manager 패턴
     try:
         redis_client = get_redis_client()
         await redis_client.zrem("cluster:heartbeats", INSTANCE_ID)
+        await redis_client.hdel("cluster:capacity", INSTANCE_ID)
     except Exception as e: # error handling 패스 안하기
         logger.error(f"Failed to remove instance from Redis during shutdown: {e}")
     finally:
         if redis_client: # 클라이언트 존재 할 때만 닫기
             await redis_client.close()
 
-    try:
-        await worker_task
-        await health_task
-        await summary_task
-        await rag_task
-    except asyncio.CancelledError:
-        pass
+    # 하나가 CancelledError 로 끝나도 나머지를 계속 기다리도록 gather
+    # 각 Worker 는 종료 시 진행 중인 작업을 drain (WORKER_SHUTDOWN_DRAIN_TIMEOUT_SEC) 한 뒤 끝나므로
+    # 모두 끝난 뒤에는 더 이상 청킹 풀 / HTTP 클라이언트를 쓰는 작업이 없음
+    await asyncio.gather(
+        worker_task,
+        health_task,
+        summary_task,
+        rag_task,
+        metrics_task,
+        loop_monitor_task,
+        semantic_cache_task,
+        index_migration_task,
+        return_exceptions=True,
+    )
+
+    shutdown_chunking_pool()
+    await clients.aclose()
 
 app = FastAPI(lifespan=main_lifespan)
 
@@ -76,7 +113,17 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "concurrency": {name: limiter.snapshot() for name, limiter in limiters.items()},
+    }
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus 스크랩 엔드포인트 (단계별 지연 / DLQ / 동시성 / 큐 길이 / 커넥션 풀)
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/test-ai")
 async def test_ai(prompt:str = "자기소개 부탁해", context:str = ""):